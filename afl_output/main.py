@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import sys
+
+# TODO: deal with the dirty hack of importing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from common_utils import *
+from args import *
+from output_dir_analyzer import *
+from coverage_comparison import *
+from series_file import *
+# the plotters of both tools are imported by name
+from edge_coverage.edge_time_plotter import plot_edge_over_time
+from edge_coverage.entry_time_plotter import plot_entry_over_time
+from crash.crash_time_plotter import plot_crash_over_time
+
+
+def output_results(analyzer):
+    config = analyzer.config
+    bucket = analyzer.bucket
+
+    # the series are computed once and shared by the plots and the data files
+    edge_series = analyzer.edge_series()
+    entry_series = analyzer.entry_series()
+    crash_series = analyzer.crash_series()
+
+    if config['plot_figure']:
+        with recorder.stage('plotting', 3):
+            plot_edge_over_time(config, edge_series, bucket, 1)
+            plot_entry_over_time(config, entry_series, bucket, 2)
+            plot_crash_over_time(config, crash_series, bucket, 3)
+
+    with recorder.stage('writing', 3 * len(edge_series)):
+        collect_series_over_time(config, entry_series, 'entry')
+        collect_series_over_time(config, edge_series, 'edge')
+        collect_series_over_time(config, crash_series, 'crash')
+
+    if config['dedup']:
+        dedup_crash_series = analyzer.dedup_crash_series()
+        if config['plot_figure']:
+            with recorder.stage('plotting', 1):
+                plot_crash_over_time(config, dedup_crash_series, bucket, 4, 'dedup_crash_no_over_time',
+                                     'No of coverage-unique crashes over time')
+        with recorder.stage('writing', len(dedup_crash_series)):
+            collect_series_over_time(config, dedup_crash_series, 'dedup_crash')
+
+    if config['hangs']:
+        hang_series = analyzer.hang_series()
+        if config['plot_figure']:
+            with recorder.stage('plotting', 1):
+                plot_crash_over_time(config, hang_series, bucket, 5, 'hang_no_over_time', 'No of hangs over time')
+        with recorder.stage('writing', len(hang_series)):
+            collect_series_over_time(config, hang_series, 'hang')
+
+    if config['tuple_coverage']:
+        tuple_series = analyzer.tuple_series()
+        if config['plot_figure']:
+            with recorder.stage('plotting', 1):
+                plot_edge_over_time(config, tuple_series, bucket, 6, 'tuple_no_over_time', 'tuple no #',
+                                    'No of (edge, hit count class) tuples covered over time')
+        with recorder.stage('writing', len(tuple_series)):
+            collect_series_over_time(config, tuple_series, 'tuple')
+
+    if config['compare'] and len(analyzer.queue.states) > 0:
+        with recorder.stage('comparison'):
+            write_comparison(config, analyzer.queue.compare())
+
+    if config['report_file'] is not None:
+        recorder.save_report(config['report_file'])
+
+
+@timed
+def main():
+    arg_parser = ArgParser(description='Analyze the queue, crashes and hangs of AFL output dirs in one pass.')
+    required_args = arg_parser.add_argument_group('required arguments')
+    required_args.add_argument('-c', help='Path to the configuration json file.', required=True)
+    arg_parser.add_argument('-j', help='Number of parallel afl-showmap workers (overrides "workers").',
+                            type=int, required=False)
+    arg_parser.add_argument('--incremental', help='Only process the entries added since the last run.',
+                            action='store_true', required=False)
+    arg_parser.add_argument('--report', help='Save the per-stage timing report (JSON) to this file.',
+                            required=False)
+    arg_parser.add_argument('--progress', help='Print the replay progress every N seconds.', type=float,
+                            metavar='N', required=False)
+
+    args = arg_parser.parse_args()
+
+    info("Welcome to use the AFL output dir utility")
+
+    config_path = args.c
+
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+        if args.j is not None:
+            config['workers'] = args.j
+        if args.incremental:
+            config['incremental'] = True
+        if args.report is not None:
+            config['report_file'] = args.report
+        if args.progress is not None:
+            config['progress_interval'] = args.progress
+        try:
+            analyzer = OutputDirAnalyzer(config)
+        except ValueError:
+            sys.exit(1)
+
+        if config['incremental']:
+            # the state files of the previous run live in the output dir
+            os.makedirs(config['output_dir'], exist_ok=True)
+        else:
+            if os.path.isdir(config['output_dir']):
+                warn("output dir %s exists, we will clear it this time" % config['output_dir'])
+                shutil.rmtree(config['output_dir'])
+
+            os.makedirs(config['output_dir'])
+
+        analyzer.run()
+
+        try:
+            output_results(analyzer)
+        except ValueError as error:
+            danger(str(error))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,182 @@
 # require python3
 import os
 import argparse
-import glob
+import csv
+import json
 import re
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# the keys we need from fuzzer_stats (AFL++ renamed some of them, both names are accepted)
+stats_keys = {
+    'start_time': 'start_time',
+    'last_update': 'last_update',
+    'execs_done': 'execs_done',
+    'execs_per_sec': 'execs_per_sec',
+    'paths_total': 'paths_total',
+    'corpus_count': 'paths_total',
+    'unique_crashes': 'unique_crashes',
+    'saved_crashes': 'unique_crashes'
+}
+stats_pattern = re.compile(r'^(%s)\s*:\s*(\S+)' % '|'.join(stats_keys.keys()), re.MULTILINE)
+
+# AFL output sub dirs which never contain a fuzzer_stats file (and may hold 100k+ files)
+afl_output_dirs = ['queue', 'crashes', 'hangs']
+
+instance_fields = ['path', 'group', 'start_time', 'last_update', 'execs_done', 'execs_per_sec',
+                   'paths_total', 'unique_crashes', 'avg_exec_speed']
+group_fields = ['group', 'instances', 'mean', 'median', 'min', 'max']
+
+
+def parse_stats_file(stats_file):
+    try:
+        with open(stats_file, 'r') as statsfile:
+            content = statsfile.read()
+    except ValueError:
+        sys.stderr.write("warning: %s is not a text file and is skipped\n" % stats_file)
+        return None
+
+    stats = {}
+    for match in stats_pattern.finditer(content):
+        value = match.group(2)
+        try:
+            stats[stats_keys[match.group(1)]] = float(value) if '.' in value else int(value)
+        except ValueError:
+            # e.g., nan/inf or a line the fuzzer is still writing
+            sys.stderr.write("warning: %s has an invalid %s (%s), ignoring it\n" % (stats_file, match.group(1), value))
+            continue
+        if len(stats) == 6:
+            break
+
+    for key in ['start_time', 'last_update', 'execs_done']:
+        if key not in stats:
+            sys.stderr.write("warning: %s has no %s and is skipped\n" % (stats_file, key))
+            return None
+    if stats['last_update'] <= stats['start_time']:
+        sys.stderr.write("warning: %s has no run time and is skipped\n" % stats_file)
+        return None
+
+    stats['avg_exec_speed'] = stats['execs_done'] / (stats['last_update'] - stats['start_time'])
+    return stats
+
+
+def scan_dir(path):
+    """
+    List one directory: returns its sub dirs to descend into and the parsed fuzzer_stats (if any).
+    """
+    sub_dirs = []
+    stats = None
+    try:
+        with os.scandir(path) as dir_entries:
+            for dir_entry in dir_entries:
+                # like glob, hidden dirs (e.g., AFL's .state) are not searched
+                if dir_entry.name.startswith('.'):
+                    continue
+                if dir_entry.is_dir(follow_symlinks=False):
+                    sub_dirs.append(dir_entry.path)
+                elif dir_entry.name == 'fuzzer_stats' and dir_entry.is_file():
+                    stats = parse_stats_file(dir_entry.path)
+                    if stats is not None:
+                        stats['path'] = os.path.abspath(dir_entry.path)
+    except OSError as e:
+        sys.stderr.write("warning: cannot scan %s (%s)\n" % (path, e))
+
+    if stats is not None:
+        sub_dirs = [sub_dir for sub_dir in sub_dirs if os.path.basename(sub_dir) not in afl_output_dirs]
+
+    return sub_dirs, stats
+
+
+def find_stats(paths, workers):
+    """
+    Walk the paths in parallel and parse every fuzzer_stats on the way.
+    """
+    all_stats = []
+    with ThreadPoolExecutor(workers) as executor:
+        pending = set(executor.submit(scan_dir, path) for path in paths)
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                sub_dirs, stats = future.result()
+                if stats is not None:
+                    all_stats.append(stats)
+                for sub_dir in sub_dirs:
+                    pending.add(executor.submit(scan_dir, sub_dir))
+
+    all_stats.sort(key=lambda stats: stats['path'])
+    return all_stats
+
+
+def group_name(stats_path, group_level):
+    # fuzzer_stats lives in the instance dir, the experiment is group_level dirs above it
+    group_dir = os.path.dirname(stats_path)
+    for i in range(0, group_level):
+        group_dir = os.path.dirname(group_dir)
+    return group_dir
+
+
+def aggregate_groups(all_stats):
+    group_speeds = {}
+    for stats in all_stats:
+        group_speeds.setdefault(stats['group'], []).append(stats['avg_exec_speed'])
+
+    groups = []
+    for group in sorted(group_speeds.keys()):
+        speeds = group_speeds[group]
+        groups.append({
+            'group': group,
+            'instances': len(speeds),
+            'mean': statistics.mean(speeds),
+            'median': statistics.median(speeds),
+            'min': min(speeds),
+            'max': max(speeds)
+        })
+    return groups
 
 
 def main():
     parser = argparse.ArgumentParser(description='avg_exec_speed: Calculate *average executions per second* for all tests in specified path (recusively)')
     parser.add_argument('path', metavar='path', type=str, nargs='+', help='the path containing *fuzzer_stats* files')
+    parser.add_argument('--format', choices=['text', 'csv', 'json'], default='text', help='output format (default: text)')
+    parser.add_argument('--summary', action='store_true', help='only output the per-group aggregates')
+    parser.add_argument('--group-level', type=int, default=1,
+                        help='how many dirs above the instance dir the experiment (group) dir is (default: 1)')
+    parser.add_argument('-j', type=int, default=16, help='number of threads scanning the paths (default: 16)')
 
     args = parser.parse_args()
 
+    paths = []
     for path in args.path:
         if os.path.isdir(path):
-            for stats_file in sorted(glob.glob(path+'/**/fuzzer_stats', recursive=True)):
-                start_time, last_update, execs_done = [0,1,-1]
-                with open(stats_file, 'r') as statsfile:
-                    for line in statsfile.readlines():
-                        hit_count = 0
-                        if re.search('^start_time', line):
-                            start_time = int(line.split()[2])
-                            hit_count += 1
-                        elif re.search('^last_update', line):
-                            last_update = int(line.split()[2])
-                            hit_count += 1
-                        elif re.search('^execs_done', line):
-                            execs_done = int(line.split()[2])
-                            hit_count += 1
-                            if hit_count == 3:
-                                break
-                print(os.path.abspath(stats_file), ': ', '{:.2f}'.format(execs_done / (last_update-start_time)))
+            paths.append(path)
         else:
-            print("warning: %s is not a path and is skipped" % path)
+            sys.stderr.write("warning: %s is not a path and is skipped\n" % path)
+
+    all_stats = find_stats(paths, max(1, args.j))
+    for stats in all_stats:
+        stats['group'] = group_name(stats['path'], args.group_level)
+    groups = aggregate_groups(all_stats)
+
+    if args.format == 'json':
+        result = {'groups': groups}
+        if not args.summary:
+            result['instances'] = [dict((field, stats.get(field)) for field in instance_fields) for stats in all_stats]
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    elif args.format == 'csv':
+        fields = group_fields if args.summary else instance_fields
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in (groups if args.summary else all_stats):
+            writer.writerow(row)
+    else:
+        if not args.summary:
+            for stats in all_stats:
+                print(stats['path'], ': ', '{:.2f}'.format(stats['avg_exec_speed']))
+        for group in groups:
+            print(group['group'], ': ', 'instances %d, mean %.2f, median %.2f, min %.2f, max %.2f'
+                  % (group['instances'], group['mean'], group['median'], group['min'], group['max']))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import os
+import random
+import sys
+# TODO: deal with the dirty hack of importing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common_utils import *
+from args import *
+
+# "uniform": entries are found evenly over the campaign; "early": most of them in the first hours, like real fuzzers
+valid_distributions = ['uniform', 'early']
+
+# the start time of every synthetic campaign (fixed, so that the corpora are reproducible)
+corpus_start_time = 1600000000
+
+
+def entry_times(rng, entry_no, span, distribution):
+    """
+    Sorted offsets (seconds since the start) of entry_no entries within span seconds.
+    """
+    if distribution == 'early':
+        offsets = [int(span * rng.random() ** 3) for i in range(0, entry_no)]
+    else:
+        offsets = [int(span * rng.random()) for i in range(0, entry_no)]
+    offsets.sort()
+    return offsets
+
+
+def write_entries(rng, entry_dir, offsets, min_size, max_size, name_times):
+    os.makedirs(entry_dir, exist_ok=True)
+    for (entry_id, offset) in enumerate(offsets):
+        if name_times:
+            # AFL++ style, the time (ms since the start) is part of the name
+            entry_name = 'id:%06d,time:%d,op:havoc' % (entry_id, offset * 1000)
+        else:
+            entry_name = 'id:%06d,op:havoc' % entry_id
+        entry_path = os.path.join(entry_dir, entry_name)
+        with open(entry_path, 'wb') as fp:
+            fp.write(bytes(rng.getrandbits(8) for i in range(0, rng.randint(min_size, max_size))))
+        m_time = corpus_start_time + offset
+        os.utime(entry_path, (m_time, m_time))
+
+
+def write_fuzzer_stats(instance_dir, span, entry_no, crash_no, execs_per_sec):
+    with open(os.path.join(instance_dir, 'fuzzer_stats'), 'w') as fp:
+        fp.write('start_time        : %d\n' % corpus_start_time)
+        fp.write('last_update       : %d\n' % (corpus_start_time + span))
+        fp.write('execs_done        : %d\n' % (execs_per_sec * span))
+        fp.write('execs_per_sec     : %.2f\n' % execs_per_sec)
+        fp.write('paths_total       : %d\n' % entry_no)
+        fp.write('unique_crashes    : %d\n' % crash_no)
+
+
+def generate_instance(instance_dir, seed, entry_no, crash_no, hours, distribution, name_times):
+    """
+    One synthetic AFL output dir: queue/, crashes/, hangs/ and fuzzer_stats.
+    """
+    rng = random.Random(seed)
+    span = int(hours * 3600)
+
+    write_entries(rng, os.path.join(instance_dir, 'queue'), entry_times(rng, entry_no, span, distribution),
+                  16, 256, name_times)
+    write_entries(rng, os.path.join(instance_dir, 'crashes'), entry_times(rng, crash_no, span, distribution),
+                  16, 256, name_times)
+    os.makedirs(os.path.join(instance_dir, 'hangs'), exist_ok=True)
+    write_fuzzer_stats(instance_dir, span, entry_no, crash_no, rng.uniform(100, 2000))
+
+
+def generate_corpus(output_dir, fuzzer_no, trial_no, entry_no, crash_no, hours, distribution, name_times, seed):
+    """
+    fuzzer_no x trial_no instances named <output_dir>/fuzzer<i>_<j>.
+    Returns key: instance name, value: instance dir.
+    """
+    instances = {}
+    for fuzzer_id in range(0, fuzzer_no):
+        for trial_id in range(0, trial_no):
+            instance_name = 'fuzzer%d_%d' % (fuzzer_id, trial_id)
+            instance_dir = os.path.join(output_dir, instance_name)
+            generate_instance(instance_dir, seed * 1000003 + fuzzer_id * 1009 + trial_id, entry_no, crash_no,
+                              hours, distribution, name_times)
+            instances[instance_name] = instance_dir
+    return instances
+
+
+def main():
+    arg_parser = ArgParser(description='Generate synthetic AFL output dirs for benchmarking.')
+    required_args = arg_parser.add_argument_group('required arguments')
+    required_args.add_argument('-o', help='The dir to generate the corpora in.', required=True)
+    arg_parser.add_argument('--fuzzers', help='Number of fuzzers (default: 2).', type=int, default=2)
+    arg_parser.add_argument('--trials', help='Number of trials per fuzzer (default: 2).', type=int, default=2)
+    arg_parser.add_argument('--entries', help='Number of queue entries per trial (default: 1000).', type=int,
+                            default=1000)
+    arg_parser.add_argument('--crashes', help='Number of crashes per trial (default: 50).', type=int, default=50)
+    arg_parser.add_argument('--hours', help='Length of the campaigns in hours (default: 24).', type=float,
+                            default=24)
+    arg_parser.add_argument('--distribution', help='How the entries are spread over time (default: early).',
+                            choices=valid_distributions, default='early')
+    arg_parser.add_argument('--name-times', help='Put AFL++ "time:<ms>" into the entry names.',
+                            action='store_true')
+    arg_parser.add_argument('--seed', help='Random seed (default: 0).', type=int, default=0)
+
+    args = arg_parser.parse_args()
+
+    instances = generate_corpus(args.o, args.fuzzers, args.trials, args.entries, args.crashes, args.hours,
+                                args.distribution, args.name_times, args.seed)
+    ok("generated %d instances in %s" % (len(instances), args.o))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+# TODO: deal with the dirty hack of importing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from common_utils import *
+from args import *
+from generate_corpus import *
+from entry_discovery import *
+from coverage_analyzer import *
+from crash_analyzer import *
+from series_file import *
+from trial_aggregator import *
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stub_showmap = os.path.join(repo_dir, 'benchmark', 'stub_showmap.py')
+
+# in this order, later scenarios reuse what the earlier ones produced
+scenario_names = ['discovery', 'replay', 'binning', 'writing', 'averaging', 'plotting', 'crash', 'cli']
+
+
+class Benchmark:
+    """
+    The scenarios share one synthetic corpus. Every scenario is prepared (untimed) and returns the function
+    to time plus some counters describing the work it does.
+    """
+    args = None
+    work_dir = ''
+    instances = None
+
+    def __init__(self, args, work_dir):
+        self.args = args
+        self.work_dir = work_dir
+        self.instances = {}
+        self.analyzer = None
+
+    def generate(self):
+        args = self.args
+        self.instances = generate_corpus(os.path.join(self.work_dir, 'corpus'), args.fuzzers, args.trials,
+                                         args.entries, args.crashes, args.hours, args.distribution, False,
+                                         args.seed)
+
+    def showmap_command(self):
+        # the stub goes by the name of afl-showmap, the flags of batch mode and binary maps are inserted after it
+        showmap_binary = os.path.join(self.work_dir, 'afl-showmap')
+        if not os.path.lexists(showmap_binary):
+            os.symlink(stub_showmap, showmap_binary)
+        return '%s --edges %d --edge-space %d --cost-ms %s -o ## -- /bin/true @@' \
+               % (showmap_binary, self.args.edges, self.args.edge_space, self.args.cost_ms)
+
+    def edge_config(self, output_name='edge_out'):
+        return {
+            'showmap_command': self.showmap_command(),
+            'showmap_output': os.path.join(self.work_dir, 'showmap_out'),
+            'targets': dict((instance_name, {'entry_dirs': [os.path.join(instance_dir, 'queue')],
+                                             'fuzzer': instance_name.split('_')[0]})
+                            for (instance_name, instance_dir) in self.instances.items()),
+            'output_dir': os.path.join(self.work_dir, output_name),
+            'entry_name_pattern': ['id:.+'],
+            'bucket': self.args.bucket,
+            'max_span': math.ceil(self.args.hours),
+            'plot_figure': False,
+            'binary_output': True,
+            'workers': self.args.workers,
+            'showmap_mode': self.args.showmap_mode,
+            'showmap_format': self.args.showmap_format
+        }
+
+    def analyzed(self):
+        if self.analyzer is None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.analyzer = CoverageAnalyzer(self.edge_config()).run()
+        return self.analyzer
+
+    def prepare_discovery(self):
+        entry_dirs = [os.path.join(instance_dir, 'queue') for instance_dir in self.instances.values()]
+
+        def run():
+            for entry_dir in entry_dirs:
+                discover_entries([entry_dir], ['id:.+'])
+
+        return run, {'entry_dirs': len(entry_dirs), 'entries': len(entry_dirs) * self.args.entries}
+
+    def prepare_replay(self):
+        def run():
+            CoverageAnalyzer(self.edge_config('replay_out')).run()
+
+        return run, {'entries': len(self.instances) * self.args.entries, 'workers': self.args.workers}
+
+    def prepare_binning(self):
+        analyzer = self.analyzed()
+
+        def run():
+            analyzer.edge_series()
+            analyzer.entry_series()
+
+        return run, {'groups': len(analyzer.edge_group_dict)}
+
+    def prepare_writing(self):
+        from edge_coverage.data_collector import collect_edge_over_time, collect_entry_over_time
+        analyzer = self.analyzed()
+        edge_series = analyzer.edge_series()
+        entry_series = analyzer.entry_series()
+
+        def run():
+            collect_edge_over_time(analyzer.config, edge_series)
+            collect_entry_over_time(analyzer.config, entry_series)
+
+        return run, {'groups': len(edge_series), 'bins': len(next(iter(edge_series.values()))[0])}
+
+    def prepare_averaging(self):
+        analyzer = self.analyzed()
+        from edge_coverage.data_collector import collect_edge_over_time
+        with contextlib.redirect_stdout(io.StringIO()):
+            collect_edge_over_time(analyzer.config, analyzer.edge_series())
+
+        fuzzer_trials = {}
+        for group_name in sorted(analyzer.edge_group_dict.keys()):
+            data_file = analyzer.config['output_dir'] + group_name + '_edge_time.txt'
+            fuzzer_trials.setdefault(fuzzer_name(analyzer.config, group_name), []).append(data_file)
+
+        def run():
+            for data_files in fuzzer_trials.values():
+                aggregator = TrialAggregator()
+                for data_file in data_files:
+                    aggregator.add(load_series(data_file, self.args.bucket))
+                aggregator.mean()
+                aggregator.ci95()
+
+        return run, {'fuzzers': len(fuzzer_trials), 'trials': self.args.trials}
+
+    def prepare_plotting(self):
+        from edge_coverage.edge_time_plotter import plot_edge_over_time
+        analyzer = self.analyzed()
+        edge_series = analyzer.edge_series()
+
+        def run():
+            plot_edge_over_time(analyzer.config, edge_series, analyzer.bucket, 1)
+
+        return run, {'groups': len(edge_series), 'plot_points': analyzer.config['plot_points']}
+
+    def prepare_crash(self):
+        def crash_config():
+            return {
+                'showmap_command': self.showmap_command(),
+                'showmap_output': os.path.join(self.work_dir, 'showmap_out'),
+                'targets': dict((instance_name, {'entry_dirs': [os.path.join(instance_dir, 'crashes')]})
+                                for (instance_name, instance_dir) in self.instances.items()),
+                'output_dir': os.path.join(self.work_dir, 'crash_out'),
+                'entry_name_pattern': ['id:.+'],
+                'bucket': self.args.bucket,
+                'max_span': math.ceil(self.args.hours),
+                'plot_figure': False,
+                'dedup': True,
+                'workers': self.args.workers,
+                'showmap_format': self.args.showmap_format
+            }
+
+        def run():
+            CrashAnalyzer(crash_config()).run().crash_series()
+
+        return run, {'crashes': len(self.instances) * self.args.crashes}
+
+    def prepare_cli(self):
+        # the coverage cache is warmed up first, so this measures everything but afl-showmap
+        # (interpreter and import startup, discovery, binning, writing, plotting)
+        config = self.edge_config('cli_out')
+        config['plot_figure'] = True
+        config['cache_dir'] = os.path.join(self.work_dir, 'cache')
+        config_file = os.path.join(self.work_dir, 'cli_config.json')
+        with open(config_file, 'w') as fp:
+            json.dump(config, fp)
+        command = [sys.executable, os.path.join(repo_dir, 'edge_coverage', 'main.py'), '-c', config_file]
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        def run():
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+        return run, {'targets': len(self.instances)}
+
+
+def time_scenario(function, repeat):
+    seconds = []
+    for i in range(0, repeat):
+        # the utilities are chatty, keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            function()
+            seconds.append(time.perf_counter() - started)
+    return {'seconds': seconds, 'best': min(seconds), 'median': statistics.median(seconds)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline_file):
+    with open(baseline_file) as fp:
+        baseline = json.load(fp)
+    for scenario_name in scenario_names:
+        if scenario_name not in results['scenarios'] or scenario_name not in baseline['scenarios']:
+            continue
+        old_median = baseline['scenarios'][scenario_name]['median']
+        new_median = results['scenarios'][scenario_name]['median']
+        log("%-10s %9.3fs -> %9.3fs (x%.2f)" % (scenario_name, old_median, new_median,
+                                                 old_median / new_median if new_median > 0 else float('inf')))
+
+
+def main():
+    arg_parser = ArgParser(description='Benchmark the fuzzer utilities on synthetic corpora.')
+    required_args = arg_parser.add_argument_group('required arguments')
+    required_args.add_argument('-o', help='The JSON file to save the results in.', required=True)
+    arg_parser.add_argument('--scenarios', help='Comma separated scenarios (default: all of %s).'
+                                                % ','.join(scenario_names), default=','.join(scenario_names))
+    arg_parser.add_argument('--repeat', help='Timed runs per scenario (default: 3).', type=int, default=3)
+    arg_parser.add_argument('--work-dir', help='Where the corpus and outputs go (default: a temporary dir, '
+                                               'removed afterwards).', required=False)
+    arg_parser.add_argument('--fuzzers', help='Number of fuzzers (default: 2).', type=int, default=2)
+    arg_parser.add_argument('--trials', help='Number of trials per fuzzer (default: 2).', type=int, default=2)
+    arg_parser.add_argument('--entries', help='Number of queue entries per trial (default: 200).', type=int,
+                            default=200)
+    arg_parser.add_argument('--crashes', help='Number of crashes per trial (default: 20).', type=int, default=20)
+    arg_parser.add_argument('--hours', help='Length of the campaigns in hours (default: 24).', type=float,
+                            default=24)
+    arg_parser.add_argument('--distribution', help='How the entries are spread over time (default: early).',
+                            choices=valid_distributions, default='early')
+    arg_parser.add_argument('--bucket', help='Bucket of the series (default: min).', default='min')
+    arg_parser.add_argument('--edges', help='Edges per input of the stub showmap (default: 64).', type=int,
+                            default=64)
+    arg_parser.add_argument('--edge-space', help='Distinct edges of the stub target (default: 4096).', type=int,
+                            default=4096)
+    arg_parser.add_argument('--cost-ms', help='Extra cost of the stub showmap per input (default: 0).',
+                            type=float, default=0)
+    arg_parser.add_argument('--workers', help='Parallel showmap workers (default: 1).', type=int, default=1)
+    arg_parser.add_argument('--showmap-mode', help='Showmap mode (default: single).', choices=valid_showmap_modes,
+                            default='single')
+    arg_parser.add_argument('--showmap-format', help='Showmap output format (default: text).',
+                            choices=valid_showmap_formats, default='text')
+    arg_parser.add_argument('--seed', help='Random seed of the corpus (default: 0).', type=int, default=0)
+    arg_parser.add_argument('--compare', help='A previous result file to compare with.', required=False)
+
+    args = arg_parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(',') if name.strip() != '']
+    for scenario_name in selected:
+        if scenario_name not in scenario_names:
+            danger("Unknown scenario %s" % scenario_name)
+            danger("Valid scenarios are : %s" % ' '.join(scenario_names))
+            sys.exit(1)
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix='fu-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'scenarios': {}
+    }
+
+    try:
+        benchmark = Benchmark(args, work_dir)
+        info("generating the corpus in %s" % work_dir)
+        benchmark.generate()
+
+        for scenario_name in scenario_names:
+            if scenario_name not in selected:
+                continue
+            (function, counters) = getattr(benchmark, 'prepare_' + scenario_name)()
+            result = time_scenario(function, args.repeat)
+            result.update(counters)
+            results['scenarios'][scenario_name] = result
+            ok("%-10s best %.3fs, median %.3fs" % (scenario_name, result['best'], result['median']))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    with open(args.o, 'w') as fp:
+        json.dump(results, fp, indent=2)
+    info("results saved to %s" % args.o)
+
+    if args.compare is not None:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# A deterministic stand-in for afl-showmap, for benchmarking only:
+#   stub_showmap.py [--edges N] [--edge-space N] [--cost-ms MS] [-r] [-b] [-i in_dir] -o out -- target @@
+# The edges of an input only depend on its content. They are drawn from edge_space ids, so the coverage of a
+# corpus saturates like a real one. --cost-ms adds a busy wait per input to emulate slow targets. -b writes the
+# binary bitmap (edge_space bytes) instead of the text map.
+import hashlib
+import os
+import random
+import sys
+import time
+
+
+def input_edges(data, edge_no, edge_space, raw_counts):
+    rng = random.Random(hashlib.sha1(data).digest())
+    edges = {}
+    for edge_id in rng.sample(range(0, edge_space), min(edge_no, edge_space)):
+        hit_count = rng.choice([1, 1, 1, 2, 3, 4, 7, 16, 64, 200])
+        if raw_counts:
+            edges[edge_id] = hit_count
+        else:
+            # afl-showmap prints the count class (1-8) unless -r is given
+            edges[edge_id] = min(hit_count.bit_length(), 8)
+    return edges
+
+
+def emit(input_path, output_path, edge_no, edge_space, raw_counts, binary, cost_ms):
+    with open(input_path, 'rb') as fp:
+        edges = input_edges(fp.read(), edge_no, edge_space, raw_counts)
+
+    deadline = time.perf_counter() + cost_ms / 1000.0
+    while time.perf_counter() < deadline:
+        pass
+
+    if binary:
+        bitmap = bytearray(edge_space)
+        for (edge_id, count) in edges.items():
+            # afl-showmap -b writes the count class as a bit (1, 2, 4, ..., 128), or the raw count with -r
+            bitmap[edge_id] = min(count, 255) if raw_counts else 1 << (count - 1)
+        with open(output_path, 'wb') as fp:
+            fp.write(bitmap)
+    else:
+        with open(output_path, 'w') as fp:
+            for edge_id in sorted(edges.keys()):
+                fp.write('%06d:%d\n' % (edge_id, edges[edge_id]))
+
+
+def main():
+    args = sys.argv[1:]
+    options = args[:args.index('--')] if '--' in args else args
+
+    def option(name, default):
+        return options[options.index(name) + 1] if name in options else default
+
+    edge_no = int(option('--edges', 64))
+    edge_space = int(option('--edge-space', 4096))
+    cost_ms = float(option('--cost-ms', 0))
+    raw_counts = '-r' in options
+    binary = '-b' in options
+    output = option('-o', None)
+    input_dir = option('-i', None)
+
+    if input_dir is not None:
+        # AFL++ batch mode: every regular file of input_dir -> output/<same name>, symlinks are skipped (lstat)
+        for file_name in sorted(os.listdir(input_dir)):
+            if os.path.islink(os.path.join(input_dir, file_name)):
+                continue
+            emit(os.path.join(input_dir, file_name), os.path.join(output, file_name), edge_no, edge_space,
+                 raw_counts, binary, cost_ms)
+    else:
+        emit(args[-1], output, edge_no, edge_space, raw_counts, binary, cost_ms)
+
+
+if __name__ == "__main__":
+    main()
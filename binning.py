@@ -0,0 +1,62 @@
+import numpy as np
+
+from common_utils import *
+
+valid_buckets = ['second', 'minute', 'hour', 'sec', 'min', 'hour', 's', 'm', 'h']
+
+
+def bucket_margin_of(bucket):
+    """
+    Seconds per bin of a bucket unit (the default bucket margin is one hour).
+    """
+    if bucket.lower() in ['minute', 'min', 'm']:
+        return 60
+    elif bucket.lower() in ['second', 'sec', 's']:
+        return 1
+    return 3600
+
+
+def bins_per_hour(bucket_margin):
+    # what bin_series expects as its bucket_margin
+    return int(3600 / bucket_margin)
+
+
+def forward_fill_bins(bin_dict, max_bin):
+    """
+    Expand a sparse bin dict (key: bin_no, value: count) into a dense series over bins 0..max_bin.
+    Every bin without a value takes the value of the closest known bin before it.
+    Returns the (1-based) x values and the y values as numpy arrays.
+    """
+    known_bins = np.fromiter(bin_dict.keys(), dtype=np.int64, count=len(bin_dict))
+    known_values = np.fromiter(bin_dict.values(), dtype=np.int64, count=len(bin_dict))
+    order = np.argsort(known_bins, kind='stable')
+    known_bins = known_bins[order]
+    known_values = known_values[order]
+
+    bin_nos = np.arange(0, max_bin + 1, dtype=np.int64)
+    # index of the last known bin <= bin_no
+    positions = np.searchsorted(known_bins, bin_nos, side='right') - 1
+
+    x_vals = bin_nos + 1
+    y_vals = known_values[positions]
+    return x_vals, y_vals
+
+
+def bin_series(config, group_dict, bucket_margin):
+    """
+    Compute the dense series of every group once, so that plotting and saving can share it.
+    bucket_margin here is the number of bins per hour.
+    key: group name, value: (x_vals, y_vals)
+    """
+    max_bin = int(config['max_span']) * bucket_margin
+
+    series = {}
+    for group_name in group_dict:
+        bin_dict = group_dict[group_name]
+
+        if 0 not in bin_dict:
+            raise ValueError('Wrongly processed dict for %s!' % group_name)
+
+        series[group_name] = forward_fill_bins(bin_dict, max_bin)
+
+    return series
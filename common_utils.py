@@ -16,11 +16,12 @@ def ascii_print(func):
 
 def timed(func):
 
-    def time_wrapper(**kwargs):
+    def time_wrapper(*args, **kwargs):
         start_time = time.time()
-        func(**kwargs)
+        result = func(*args, **kwargs)
         end_time = time.time()
         info("function %s takes %fs to execute" % (func.__name__, (end_time - start_time)))
+        return result
 
     return time_wrapper
 
@@ -0,0 +1,506 @@
+import os
+import time
+import numpy as np
+
+from common_utils import *
+from target_config import *
+from showmap_runner import *
+from coverage_cache import *
+from resume_state import *
+from entry_discovery import *
+from coverage_map import *
+from binning import *
+from downsampling import *
+from plot_data import *
+from edge_index import *
+from coverage_comparison import *
+from sharding import *
+from instrumentation import *
+
+valid_data_sources = ['showmap', 'plot_data']
+
+
+def sanitize_config(config):
+    required_params = ['targets', 'output_dir', 'entry_name_pattern', 'bucket']
+
+    if 'data_source' not in config:
+        config['data_source'] = 'showmap'
+
+    if config['data_source'] not in valid_data_sources:
+        danger("Invalid data source")
+        danger("Valid data sources are : %s" % ' '.join(valid_data_sources))
+        return False
+
+    # afl-showmap is not needed when the curves come from plot_data
+    if config['data_source'] == 'showmap':
+        required_params += ['showmap_command', 'showmap_output']
+
+    for param in required_params:
+        if param not in config:
+            danger("%s is missing in the config file" % param)
+            return False
+
+    if len(config['targets']) == 0:
+        danger("No target specified")
+        return False
+
+    if config['bucket'].lower() not in valid_buckets:
+        danger("Invalid bucket unit")
+        danger("Valid units are : %s" % ' '.join(valid_buckets))
+        return False
+
+    # some amendments to config
+    if not config['output_dir'].endswith('/'):
+        config['output_dir'] += '/'
+
+    if 'plot_figure' not in config:
+        config['plot_figure'] = True
+
+    if not sanitize_downsampling(config):
+        return False
+
+    # the instrumentation report (JSON) is only written when a file is given
+    if 'report_file' not in config:
+        config['report_file'] = None
+
+    # unit is second, 0 means no progress lines
+    if 'progress_interval' not in config:
+        config['progress_interval'] = 0
+
+    if 'workers' not in config:
+        config['workers'] = 1
+
+    if int(config['workers']) < 1:
+        danger("workers should be at least 1")
+        return False
+
+    if 'showmap_mode' not in config:
+        config['showmap_mode'] = 'single'
+
+    if config['showmap_mode'] not in valid_showmap_modes:
+        danger("Invalid showmap mode")
+        danger("Valid modes are : %s" % ' '.join(valid_showmap_modes))
+        return False
+
+    if 'batch_size' not in config:
+        config['batch_size'] = 1000
+
+    if 'cache_dir' not in config:
+        config['cache_dir'] = None
+
+    # unit is MB
+    if 'cache_max_size' not in config:
+        config['cache_max_size'] = 1024
+
+    if not sanitize_showmap_settings(config):
+        return False
+
+    if 'map_size' not in config:
+        config['map_size'] = default_map_size
+
+    if 'binary_output' not in config:
+        config['binary_output'] = False
+
+    if 'timestamp_source' not in config:
+        config['timestamp_source'] = 'mtime'
+
+    if config['timestamp_source'] not in valid_timestamp_sources:
+        danger("Invalid timestamp source")
+        danger("Valid timestamp sources are : %s" % ' '.join(valid_timestamp_sources))
+        return False
+
+    if 'edge_index' not in config:
+        config['edge_index'] = True
+
+    if 'tuple_coverage' not in config:
+        config['tuple_coverage'] = False
+
+    if 'compare' not in config:
+        config['compare'] = False
+
+    if config['data_source'] == 'plot_data' and config['compare']:
+        warn("compare needs the coverage bitmaps of afl-showmap, it is not used with plot_data")
+        config['compare'] = False
+
+    if config['data_source'] == 'plot_data' and config['tuple_coverage']:
+        warn("tuple_coverage needs the hit counts of afl-showmap, it is not used with plot_data")
+        config['tuple_coverage'] = False
+
+    if 'incremental' not in config:
+        config['incremental'] = False
+
+    if 'watch' not in config:
+        config['watch'] = False
+
+    # unit is second
+    if 'watch_interval' not in config:
+        config['watch_interval'] = 60
+
+    if 'watch_max_entries' not in config:
+        config['watch_max_entries'] = 1000
+
+    if config['data_source'] == 'plot_data' and (config['incremental'] or config['watch']):
+        warn("incremental and watch modes are not used with plot_data (reading it is cheap)")
+        config['incremental'] = False
+        config['watch'] = False
+
+    return True
+
+
+def init_target_state(config, group_name, target, bucket_margin):
+    signature = {
+        'showmap_command': config['showmap_command'],
+        'entry_dirs': target['entry_dirs'],
+        'entry_name_pattern': config['entry_name_pattern'],
+        'timestamp_source': config['timestamp_source'],
+        'start_time': int(target['start_time']),
+        'bucket_margin': bucket_margin
+    }
+    if config['tuple_coverage']:
+        signature['tuple_coverage'] = True
+
+    state = None
+    if config['incremental']:
+        state = load_state(config, group_name, signature)
+    if state is None:
+        state = new_state(signature)
+        state['covered_edges'] = []
+        state['bin_dicts'] = {'edge': {}, 'entry': {}}
+        if config['tuple_coverage']:
+            state['covered_tuples'] = [[], []]
+            state['bin_dicts']['tuple'] = {}
+
+    return state
+
+
+def process_entries(config, group_name, entries, state, cache):
+    """
+    Replay the (new) entries of a target and update the bins kept in the state.
+    """
+    covered_map = edges_to_map(state['covered_edges'], int(config['map_size']))
+    covered_edge_no = len(state['covered_edges'])
+    # key: bin_no, value: edge count
+    edge_no_dict = state['bin_dicts']['edge']
+    # key: bin_no, value: entry count
+    entry_no_dict = state['bin_dicts']['entry']
+    entry_count = state['entry_count']
+
+    if config['tuple_coverage']:
+        tuple_map = list_to_tuple_map(state['covered_tuples'], covered_map.size)
+        covered_tuple_no = tuple_count(tuple_map)
+        # key: bin_no, value: (edge, count class) tuple count
+        tuple_no_dict = state['bin_dicts']['tuple']
+        # "-r" makes afl-showmap report raw hit counts instead of count classes
+        raw_counts = '-r' in config['showmap_command'].split(' ')
+
+    entries = filter_new_entries(entries, state)
+
+    # first discovery of every edge, only the entries covering new edges matter
+    index_rows = []
+    index_contributions = []
+    # the index of an earlier run (or poll) is extended, otherwise it is started from scratch
+    index_append = entry_count > 0
+
+    # check each entry file
+    for (entry, (edge_ids, edge_counts)) in zip(entries, replay_entries(config, entries, cache)):
+        # info("checking %s -- %d" % (entry.path, entry.m_time), 1)
+
+        if config['edge_index']:
+            covered_map, new_edge_ids = merge_new_edges(covered_map, edge_ids)
+            new_edge_no = len(new_edge_ids)
+            if new_edge_no > 0:
+                index_rows.append(new_edge_rows(new_edge_ids, entry.m_time - state['signature']['start_time'],
+                                                entry_count + 1))
+                index_contributions.append((entry_count + 1, entry.m_time, new_edge_no, entry.path))
+        else:
+            covered_map, new_edge_no = merge_coverage(covered_map, edge_ids)
+        covered_edge_no += new_edge_no
+        recorder.progress(group_name, entry_count - state['entry_count'] + 1, len(entries))
+
+        if config['tuple_coverage']:
+            tuple_map, new_tuple_no = merge_tuples(tuple_map, edge_ids, count_class_bits(edge_counts, raw_counts))
+            covered_tuple_no += new_tuple_no
+            tuple_no_dict[entry.bin_no] = covered_tuple_no
+
+        # update the edge_no dict
+        # NOTE: temporarily no difference
+        entry_count += 1
+        entry_no_dict[entry.bin_no] = entry_count
+
+        if entry.bin_no not in edge_no_dict:
+            edge_no_dict[entry.bin_no] = covered_edge_no
+        else:
+            edge_no_dict[entry.bin_no] = covered_edge_no
+
+    if 0 not in edge_no_dict:
+        edge_no_dict[0]= 0
+    if 0 not in entry_no_dict:
+        entry_no_dict[0]= 0
+    if config['tuple_coverage'] and 0 not in tuple_no_dict:
+        tuple_no_dict[0] = 0
+
+    advance_watermark(state, entries)
+    state['covered_edges'] = map_to_edges(covered_map)
+    if config['tuple_coverage']:
+        state['covered_tuples'] = tuple_map_to_list(tuple_map)
+
+    if config['edge_index'] and (len(entries) > 0 or not index_append):
+        save_edge_index(config['output_dir'], group_name, index_rows, index_contributions, index_append)
+
+    failures = take_showmap_failures()
+    if len(failures) > 0:
+        save_showmap_failures(config, group_name, failures, index_append)
+
+    if config['incremental']:
+        save_state(config, group_name, state)
+
+    return len(entries)
+
+
+class CoverageAnalyzer:
+    """
+    In-process edge coverage analysis of the targets of an edge_coverage config (see edge_coverage/README.md):
+
+        analyzer = CoverageAnalyzer(config)
+        analyzer.run()
+        (x_vals, y_vals) = analyzer.edge_series()['afl']
+
+    The series are numpy arrays over the bins of max_span. Figures and *_time.txt files are left to
+    edge_coverage/main.py, only the files the config asks for (state, edge index) are written to output_dir.
+    """
+    config = None
+    bucket = ''
+    bucket_margin = 0
+    cache = None
+
+    def __init__(self, config, cache=None):
+        if not sanitize_config(config):
+            raise ValueError("invalid edge coverage config")
+        self.config = config
+        self.bucket = config['bucket']
+        # unit is second
+        self.bucket_margin = bucket_margin_of(self.bucket)
+        recorder.progress_interval = float(config['progress_interval'])
+
+        self.cache = cache
+        if cache is None and config['cache_dir'] is not None and config['data_source'] == 'showmap':
+            self.cache = CoverageCache(config['cache_dir'], config['showmap_command'],
+                                       int(config['cache_max_size']) * 1024 * 1024)
+
+        # key: entry group name, value: state of the target (see resume_state)
+        self.states = {}
+        # key: entry group name, value: edge_no_dict
+        self.edge_group_dict = {}
+        # key: entry group name, value: entry_no_dict
+        self.entry_group_dict = {}
+        # key: entry group name, value: crash_no_dict (only filled from plot_data)
+        self.crash_group_dict = {}
+        # key: entry group name, value: tuple_no_dict (only with tuple_coverage)
+        self.tuple_group_dict = {}
+        # key: entry group name, value: what watch mode needs to know about the target
+        self.watched_targets = {}
+
+    def analyze_target(self, group_name):
+        """
+        Process one target of the config. Returns False if the target is skipped.
+        """
+        config = self.config
+        target = config['targets'][group_name]
+        with recorder.stage('start_time'):
+            if not sanitize_target(target):
+                return False
+        start_time = int(target['start_time'])
+
+        if config['data_source'] == 'plot_data':
+            plot_data_file = find_plot_data(target)
+            if plot_data_file is None:
+                danger("no plot_data found for %s, skipping" % group_name)
+                return False
+            with recorder.stage('plot_data'):
+                (self.edge_group_dict[group_name], self.entry_group_dict[group_name],
+                 self.crash_group_dict[group_name]) = \
+                    read_plot_data(plot_data_file, start_time, self.bucket_margin, int(config['map_size']))
+            ok("%s - Approximate number of covered edges: %d"
+               % (group_name, self.edge_group_dict[group_name][max(self.edge_group_dict[group_name].keys())]))
+            return True
+
+        known_files = set() if config['watch'] else None
+        state = self.target_state(group_name)
+
+        # collect entry files first (only the ones the state has not seen)
+        with recorder.stage('scan'):
+            entries = collect_entries(config, target['entry_dirs'], start_time, self.bucket_margin, known_files,
+                                      state)
+        recorder.add_items('scan', len(entries))
+
+        return self.analyze_entries(group_name, entries, known_files, state)
+
+    def target_state(self, group_name):
+        """
+        The state of a target: the one saved by the previous run (incremental) or a fresh one.
+        """
+        return init_target_state(self.config, group_name, self.config['targets'][group_name], self.bucket_margin)
+
+    def analyze_entries(self, group_name, entries, known_files=None, state=None):
+        """
+        Replay the entries of a target which were collected already (its start_time is known).
+        known_files -- the files seen by the scan, only in watch mode
+        state -- the state of the target (see target_state) if the entries were collected with it
+        """
+        config = self.config
+        target = config['targets'][group_name]
+        if state is None:
+            state = self.target_state(group_name)
+        if state['entry_count'] > 0:
+            info("%d new entries since the last run" % len(filter_new_entries(entries, state)), 1)
+
+        self.replay(group_name, entries, state)
+
+        self.states[group_name] = state
+        self.edge_group_dict[group_name] = state['bin_dicts']['edge']
+        self.entry_group_dict[group_name] = state['bin_dicts']['entry']
+        ok("%s - Total number of covered edges: %d" % (group_name, len(state['covered_edges'])))
+        if config['tuple_coverage']:
+            self.tuple_group_dict[group_name] = state['bin_dicts']['tuple']
+            ok("%s - Total number of covered tuples: %d"
+               % (group_name, state['bin_dicts']['tuple'][max(state['bin_dicts']['tuple'].keys())]))
+        ok("%s - Total number of entries: %d" % (group_name, state['entry_count']))
+
+        if config['watch']:
+            self.watched_targets[group_name] = {'target': target, 'known_files': known_files, 'pending': []}
+
+        return True
+
+    def run(self, group_names=None):
+        """
+        Analyze the targets of the config (only group_names if given, e.g., the targets of a shard).
+        """
+        os.makedirs(self.config['output_dir'], exist_ok=True)
+
+        for target_key in self.config['targets']:
+            if group_names is not None and target_key not in group_names:
+                continue
+            info("checking for %s" % target_key)
+            if not self.analyze_target(target_key):
+                danger("skipping")
+
+        if self.cache is not None:
+            self.cache.evict()
+
+        return self
+
+    def poll(self):
+        """
+        Replay the entries the fuzzers wrote since the last run/poll (watch mode).
+        At most watch_max_entries entries are replayed per target, the rest is left to the next poll.
+        Returns the number of replayed entries.
+        """
+        max_entries = int(self.config['watch_max_entries'])
+
+        processed = 0
+        for group_name in sorted(self.watched_targets.keys()):
+            watched = self.watched_targets[group_name]
+            target = watched['target']
+            watched['pending'] += collect_entries(self.config, target['entry_dirs'], int(target['start_time']),
+                                                  self.bucket_margin, watched['known_files'],
+                                                  self.states[group_name])
+            watched['pending'].sort(key=lambda x: x.m_time, reverse=False)
+
+            entries = watched['pending'][:max_entries]
+            watched['pending'] = watched['pending'][max_entries:]
+            if len(entries) == 0:
+                continue
+
+            state = self.states[group_name]
+            processed += self.replay(group_name, entries, state)
+            ok("%s - Total number of covered edges: %d" % (group_name, len(state['covered_edges'])))
+            ok("%s - Total number of entries: %d" % (group_name, state['entry_count']))
+
+        return processed
+
+    def group_results(self):
+        """
+        start_time and state of every analyzed target, as saved by a shard (see sharding).
+        """
+        group_results = {}
+        for group_name in self.edge_group_dict:
+            if group_name in self.states:
+                state = self.states[group_name]
+            else:
+                # plot_data only has the bins
+                state = {'bin_dicts': {'edge': self.edge_group_dict[group_name],
+                                       'entry': self.entry_group_dict[group_name],
+                                       'crash': self.crash_group_dict[group_name]}}
+            group_results[group_name] = {'start_time': int(self.config['targets'][group_name]['start_time']),
+                                         'state': state}
+        return group_results
+
+    def merge_shards(self):
+        """
+        Take the results of all shards under output_dir as if their targets were analyzed here.
+        Returns False if shards are missing or do not fit the config.
+        """
+        shards = load_shards(self.config, 'edge_coverage')
+        if shards is None:
+            return False
+
+        for (shard_dir, shard) in shards:
+            info("merging shard %d/%d (%d targets)" % (shard['shard'], shard['shard_count'], len(shard['groups'])))
+            for group_name in sorted(shard['groups'].keys()):
+                if group_name not in self.config['targets']:
+                    warn("%s is not a target of the config, skipping" % group_name, 1)
+                    continue
+                group_result = shard['groups'][group_name]
+                self.config['targets'][group_name]['start_time'] = group_result['start_time']
+                state = group_result['state']
+                bin_dicts = state['bin_dicts']
+
+                self.edge_group_dict[group_name] = bin_dicts['edge']
+                self.entry_group_dict[group_name] = bin_dicts['entry']
+                if 'crash' in bin_dicts:
+                    self.crash_group_dict[group_name] = bin_dicts['crash']
+                if 'tuple' in bin_dicts:
+                    self.tuple_group_dict[group_name] = bin_dicts['tuple']
+                if 'covered_edges' in state:
+                    self.states[group_name] = state
+
+                copy_shard_files(shard_dir, self.config['output_dir'], group_name,
+                                 ['_edge_index.npy', '_edge_index_entries.txt', '_showmap_failures.json'])
+
+        return True
+
+    def replay(self, group_name, entries, state):
+        recorder.target = group_name
+        started = time.perf_counter()
+        with recorder.stage('replay'):
+            processed = process_entries(self.config, group_name, entries, state, self.cache)
+        recorder.add_items('replay', processed)
+        recorder.add_target(group_name, processed, time.perf_counter() - started)
+        recorder.target = None
+        return processed
+
+    def series(self, group_dict):
+        with recorder.stage('binning', len(group_dict)):
+            return bin_series(self.config, group_dict, bins_per_hour(self.bucket_margin))
+
+    def edge_series(self):
+        return self.series(self.edge_group_dict)
+
+    def entry_series(self):
+        return self.series(self.entry_group_dict)
+
+    def tuple_series(self):
+        return self.series(self.tuple_group_dict)
+
+    def crash_series(self):
+        return self.series(self.crash_group_dict)
+
+    def covered_edges(self, group_name):
+        return np.asarray(self.states[group_name]['covered_edges'], dtype=np.uint32)
+
+    def compare(self):
+        """
+        Compare the final coverage of the analyzed targets, see compare_fuzzers.
+        """
+        return compare_fuzzers(self.config, dict((group_name, self.states[group_name]['covered_edges'])
+                                                 for group_name in self.states))
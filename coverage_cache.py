@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import numpy as np
+
+from common_utils import *
+
+# bumped whenever the layout of the cached files changes, old entries are simply not found anymore
+cache_format_version = 2
+
+# the layout of the cache: <fingerprint>/<first 2 hex of the content hash>/<remaining 38 hex>
+cache_fingerprint_pattern = re.compile(r'[0-9a-f]{40}')
+cache_prefix_pattern = re.compile(r'[0-9a-f]{2}')
+cache_name_pattern = re.compile(r'[0-9a-f]{38}')
+
+
+def command_fingerprint(showmap_command):
+    """
+    Fingerprint of the showmap command. Besides the command line itself, the size and mtime of
+    every file mentioned in it (showmap binary, target binary, dictionaries...) are taken into
+    account, so rebuilding the target invalidates the cached coverage.
+    """
+    fingerprint = hashlib.sha1(('%d:%s' % (cache_format_version, showmap_command)).encode())
+    for token in showmap_command.split(' '):
+        if os.path.isfile(token):
+            token_stat = os.stat(token)
+            fingerprint.update(('%s:%d:%d' % (token, token_stat.st_size, int(token_stat.st_mtime))).encode())
+    return fingerprint.hexdigest()
+
+
+def content_hash(path):
+    with open(path, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+class CoverageCache:
+    """
+    On-disk cache: (showmap command fingerprint, entry content hash) -> edge ids and hit counts of the entry.
+    Every cached entry is a small file holding the sorted edge ids as packed uint32, followed by their
+    hit counts as uint8.
+    The least recently used files are evicted once the cache grows beyond max_size bytes.
+    """
+    cache_dir = ''
+    max_size = 0
+
+    def __init__(self, cache_dir, showmap_command, max_size):
+        self.cache_dir = os.path.join(os.path.abspath(cache_dir), command_fingerprint(showmap_command))
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key[2:])
+
+    def contains(self, key):
+        return os.path.isfile(self.key_path(key))
+
+    def get(self, key):
+        key_path = self.key_path(key)
+        try:
+            with open(key_path, 'rb') as fp:
+                data = fp.read()
+        except (IOError, OSError):
+            return None
+        # 4 bytes id + 1 byte count per edge
+        if len(data) % 5 != 0:
+            return None
+        edge_no = int(len(data) / 5)
+        edge_ids = np.frombuffer(data, dtype='<u4', count=edge_no).astype(np.uint32)
+        edge_counts = np.frombuffer(data, dtype=np.uint8, offset=edge_no * 4).copy()
+        # mtime is used as the "last used" time for eviction
+        os.utime(key_path, None)
+        return edge_ids, edge_counts
+
+    def put(self, key, edges):
+        (edge_ids, edge_counts) = edges
+        order = np.argsort(edge_ids, kind='stable')
+        key_path = self.key_path(key)
+        os.makedirs(os.path.dirname(key_path), exist_ok=True)
+        temp_path = '%s.%d.tmp' % (key_path, os.getpid())
+        with open(temp_path, 'wb') as fp:
+            fp.write(np.asarray(edge_ids, dtype='<u4')[order].tobytes())
+            fp.write(np.asarray(edge_counts, dtype=np.uint8)[order].tobytes())
+        os.replace(temp_path, key_path)
+
+    def cached_files(self):
+        """
+        The files of every fingerprint under cache_dir which follow the cache layout
+        (<40 hex fingerprint>/<2 hex>/<38 hex>), as (mtime, size, path). Anything else in cache_dir is left alone,
+        and so are the *.tmp files other processes are still writing.
+        """
+        cache_root = os.path.dirname(self.cache_dir)
+        cached_files = []
+        for fingerprint_dir in os.listdir(cache_root):
+            fingerprint_path = os.path.join(cache_root, fingerprint_dir)
+            if cache_fingerprint_pattern.fullmatch(fingerprint_dir) is None or not os.path.isdir(fingerprint_path):
+                continue
+            for prefix_dir in os.listdir(fingerprint_path):
+                prefix_path = os.path.join(fingerprint_path, prefix_dir)
+                if cache_prefix_pattern.fullmatch(prefix_dir) is None or not os.path.isdir(prefix_path):
+                    continue
+                for file_name in os.listdir(prefix_path):
+                    if cache_name_pattern.fullmatch(file_name) is None:
+                        continue
+                    file_path = os.path.join(prefix_path, file_name)
+                    try:
+                        file_stat = os.stat(file_path)
+                    except FileNotFoundError:
+                        # evicted by another process in the meantime
+                        continue
+                    cached_files.append((file_stat.st_mtime, file_stat.st_size, file_path))
+        return cached_files
+
+    def evict(self):
+        cached_files = self.cached_files()
+        total_size = sum(size for (m_time, size, file_path) in cached_files)
+
+        if total_size <= self.max_size:
+            return
+
+        # drop the least recently used files until we are comfortably below the limit
+        cached_files.sort()
+        target_size = int(self.max_size * 0.9)
+        removed = 0
+        for (m_time, size, file_path) in cached_files:
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(file_path)
+                removed += 1
+            except FileNotFoundError:
+                # another process evicted it first
+                pass
+            total_size -= size
+        info("evicted %d entries from the coverage cache" % removed)
@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+
+from common_utils import *
+from coverage_map import *
+
+
+def fuzzer_name(config, group_name):
+    # the trials of a fuzzer are the targets sharing the same "fuzzer", a target without it is its own fuzzer
+    return config['targets'][group_name].get('fuzzer', group_name)
+
+
+def stack_maps(edge_lists, map_size):
+    """
+    One row of coverage bitmap per edge list.
+    """
+    for edges in edge_lists:
+        if len(edges) > 0 and max(edges) >= map_size:
+            map_size = grown_map_size(max(edges), map_size)
+    maps = np.zeros((len(edge_lists), map_size), dtype=np.bool_)
+    for (row, edges) in enumerate(edge_lists):
+        maps[row, np.asarray(edges, dtype=np.int64)] = True
+    return maps
+
+
+def compare_maps(maps):
+    """
+    Pairwise comparison of coverage bitmaps (one per row).
+    shared[a][b] is the number of edges covered by both a and b (shared[a][a] is the coverage of a),
+    unique[a][b] the number of edges covered by a but not by b.
+    """
+    # AND + popcount of all pairs at once
+    hits = maps.astype(np.float32)
+    shared = np.rint(hits @ hits.T).astype(np.int64)
+    unique = np.diag(shared)[:, np.newaxis] - shared
+    return shared, unique
+
+
+def write_matrix(file_name, names, matrix):
+    with open(file_name, 'w') as fp:
+        fp.write(','.join(['fuzzer'] + names) + '\n')
+        for (name, row) in zip(names, matrix.tolist()):
+            fp.write(','.join([name] + ['%d' % value for value in row]) + '\n')
+
+
+def compare_fuzzers(config, covered_edge_dict):
+    """
+    Compare the final coverage of the fuzzers (trials are merged into the union of their bitmaps).
+    covered_edge_dict -- key: entry group name, value: covered edge ids
+    Returns a dict of the fuzzer names, their trials, the pairwise shared/unique matrices (see compare_maps),
+    the union/intersection edge counts across the trials and the edges no other fuzzer covered.
+    """
+    group_names = sorted(covered_edge_dict.keys())
+    trial_maps = stack_maps([covered_edge_dict[group_name] for group_name in group_names], int(config['map_size']))
+
+    # key: fuzzer name, value: rows of its trials in trial_maps
+    fuzzer_trials = {}
+    for (row, group_name) in enumerate(group_names):
+        fuzzer_trials.setdefault(fuzzer_name(config, group_name), []).append(row)
+    fuzzer_names = sorted(fuzzer_trials.keys())
+
+    union_maps = np.stack([trial_maps[fuzzer_trials[name]].any(axis=0) for name in fuzzer_names])
+    intersection_maps = np.stack([trial_maps[fuzzer_trials[name]].all(axis=0) for name in fuzzer_names])
+
+    (shared, unique) = compare_maps(union_maps)
+
+    # the edges covered by exactly one fuzzer
+    only_maps = union_maps & (union_maps.sum(axis=0) == 1)
+
+    return {
+        'fuzzers': fuzzer_names,
+        'trials': dict((name, [group_names[row] for row in fuzzer_trials[name]]) for name in fuzzer_names),
+        'shared': shared,
+        'unique': unique,
+        'union': np.count_nonzero(union_maps, axis=1),
+        'intersection': np.count_nonzero(intersection_maps, axis=1),
+        'only_edges': dict((name, np.flatnonzero(only_maps[row])) for (row, name) in enumerate(fuzzer_names))
+    }
+
+
+def write_comparison(config, comparison):
+    """
+    Write comparison_shared.csv, comparison_unique.csv (pairwise edge counts), comparison_summary.csv
+    (union/intersection across the trials, edges no other fuzzer covered) and comparison_only_edges.json.
+    """
+    fuzzer_names = comparison['fuzzers']
+    info("saving coverage comparison of %d fuzzers" % len(fuzzer_names))
+
+    write_matrix(os.path.join(config['output_dir'], 'comparison_shared.csv'), fuzzer_names, comparison['shared'])
+    write_matrix(os.path.join(config['output_dir'], 'comparison_unique.csv'), fuzzer_names, comparison['unique'])
+
+    with open(os.path.join(config['output_dir'], 'comparison_summary.csv'), 'w') as fp:
+        fp.write('fuzzer,trials,union,intersection,only\n')
+        for (row, name) in enumerate(fuzzer_names):
+            fp.write('%s,%d,%d,%d,%d\n' % (name, len(comparison['trials'][name]), comparison['union'][row],
+                                           comparison['intersection'][row], len(comparison['only_edges'][name])))
+
+    with open(os.path.join(config['output_dir'], 'comparison_only_edges.json'), 'w') as fp:
+        json.dump(dict((name, edges.tolist()) for (name, edges) in comparison['only_edges'].items()), fp)
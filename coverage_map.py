@@ -0,0 +1,115 @@
+import numpy as np
+
+from common_utils import *
+
+# MAP_SIZE of a default AFL build
+default_map_size = 1 << 16
+
+# AFL count classes as bits: raw hit count -> bucket (1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+)
+count_class_lookup = np.zeros(256, dtype=np.uint8)
+count_class_lookup[1] = 1
+count_class_lookup[2] = 2
+count_class_lookup[3] = 4
+count_class_lookup[4:8] = 8
+count_class_lookup[8:16] = 16
+count_class_lookup[16:32] = 32
+count_class_lookup[32:128] = 64
+count_class_lookup[128:] = 128
+
+# number of set bits of every uint8
+bit_count_lookup = np.array([bin(i).count('1') for i in range(0, 256)], dtype=np.uint8)
+
+
+def new_coverage_map(map_size):
+    return np.zeros(map_size, dtype=np.bool_)
+
+
+def edges_to_map(edges, map_size):
+    """
+    Turn the edge ids reported by afl-showmap into a bitmap of map_size.
+    """
+    edge_ids = np.asarray(edges, dtype=np.int64)
+    if edge_ids.size > 0 and edge_ids.max() >= map_size:
+        map_size = grown_map_size(int(edge_ids.max()), map_size)
+    entry_map = new_coverage_map(map_size)
+    entry_map[edge_ids] = True
+    return entry_map
+
+
+def grown_map_size(max_edge_id, map_size):
+    while max_edge_id >= map_size:
+        map_size *= 2
+    warn("edge id %d is out of the map, growing map_size to %d (check the map_size setting)"
+         % (max_edge_id, map_size), 1)
+    return map_size
+
+
+def merge_new_edges(covered_map, edge_ids):
+    """
+    Mark the edges of an entry as covered, touching only its edges (the cost does not grow with map_size).
+    Returns the merged map and the ids of the edges the entry newly covers.
+    """
+    edge_ids = np.asarray(edge_ids, dtype=np.int64)
+    if edge_ids.size > 0 and edge_ids.max() >= covered_map.size:
+        map_size = grown_map_size(int(edge_ids.max()), covered_map.size)
+        covered_map = np.concatenate((covered_map, new_coverage_map(map_size - covered_map.size)))
+    new_edge_ids = edge_ids[~covered_map[edge_ids]]
+    covered_map[new_edge_ids] = True
+    return covered_map, new_edge_ids.astype(np.uint32)
+
+
+def merge_coverage(covered_map, edge_ids):
+    """
+    Same as merge_new_edges, but returns the number of newly covered edges instead of their ids.
+    """
+    covered_map, new_edge_ids = merge_new_edges(covered_map, edge_ids)
+    return covered_map, len(new_edge_ids)
+
+
+def map_to_edges(covered_map):
+    return np.flatnonzero(covered_map).tolist()
+
+
+def count_class_bits(edge_counts, raw_counts):
+    """
+    The count class of every hit count as a bit.
+    afl-showmap reports the class number (1-8) by default, and the raw hit count with -r.
+    """
+    edge_counts = np.asarray(edge_counts, dtype=np.uint8)
+    if raw_counts:
+        return count_class_lookup[edge_counts]
+    return np.left_shift(1, np.clip(edge_counts, 1, 8) - 1).astype(np.uint8)
+
+
+def new_tuple_map(map_size):
+    return np.zeros(map_size, dtype=np.uint8)
+
+
+def merge_tuples(tuple_map, edge_ids, class_bits):
+    """
+    OR the count classes of an entry into the tuple map (one byte of seen classes per edge, like AFL's virgin map).
+    Returns the merged map and the number of (edge, count class) tuples the entry newly covers.
+    """
+    edge_ids = np.asarray(edge_ids, dtype=np.int64)
+    if edge_ids.size > 0 and edge_ids.max() >= tuple_map.size:
+        map_size = grown_map_size(int(edge_ids.max()), tuple_map.size)
+        tuple_map = np.concatenate((tuple_map, new_tuple_map(map_size - tuple_map.size)))
+    new_bits = class_bits & ~tuple_map[edge_ids]
+    tuple_map[edge_ids] |= class_bits
+    return tuple_map, int(bit_count_lookup[new_bits].sum(dtype=np.int64))
+
+
+def tuple_map_to_list(tuple_map):
+    edge_ids = np.flatnonzero(tuple_map)
+    return [edge_ids.tolist(), tuple_map[edge_ids].tolist()]
+
+
+def list_to_tuple_map(tuple_list, map_size):
+    (edge_ids, class_bits) = tuple_list
+    tuple_map = new_tuple_map(map_size)
+    tuple_map, _ = merge_tuples(tuple_map, edge_ids, np.asarray(class_bits, dtype=np.uint8))
+    return tuple_map
+
+
+def tuple_count(tuple_map):
+    return int(bit_count_lookup[tuple_map].sum(dtype=np.int64))
@@ -1,10 +1,8 @@
 import json
 import os
-import re
 import shutil
-import subprocess
 import sys
-import matplotlib.pyplot as plt
+import time
 
 # TODO: deal with the dirty hack of importing
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,181 +10,154 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from common_utils import *
 from args import *
-from entry import *
 from crash_time_plotter import *
 from data_collector import *
+from crash_analyzer import *
 
 
-def sanitize_config(config):
-    required_params = ['output_dir', 'targets', 'entry_name_pattern', 'bucket']
-
-    valid_buckets = ['second', 'minute', 'hour', 'sec', 'min', 'hour', 's', 'm', 'h']
-
-    for param in required_params:
-        if param not in config:
-            danger("%s is missing in the config file" % param)
-            return False
-
-    if len(config['targets']) == 0:
-        danger("No target specified")
-        return False
-
-    if config['bucket'].lower() not in valid_buckets:
-        danger("Invalid bucket unit")
-        danger("Valid units are : %s" % ' '.join(valid_buckets))
-        return False
-
-    # some amendments to config
-    if not config['output_dir'].endswith('/'):
-        config['output_dir'] += '/'
-
-    if 'plot_figure' not in config:
-        config['plot_figure'] = True
-
-    return True
-
-
-def sanitize_target(target):
-    required_params = ['entry_dirs']
-
-    for param in required_params:
-        if param not in target:
-            danger("%s is missing in target")
-            return False
-
-    if len(target['entry_dirs']) == 0:
-        danger('No entry dir specified for target')
-        return False
-
-    else:
-        # fuzzy finding
-        fuzzy_stats_loc = ['/../fuzzer_stats', '/fuzzer_stats']
-        stats_file_found = False
-        stats_file = None
-        for entry_dir in target['entry_dirs']:
-            for stats_loc in fuzzy_stats_loc:
-                stats_file = os.path.abspath(entry_dir) + stats_loc
-                if os.path.isfile(stats_file):
-                    stats_file_found = True
-                    break
-            if stats_file_found:
-                break
-
-        if not stats_file_found and 'start_time' not in target:
-            danger('Neither start_time or fuzzer_stats found')
-            return False
-        elif stats_file_found:
-            # coexistence allowed but warn user
-            if 'start_time' in target:
-                warn('Warning: both "start_time" and fuzzer_stats file exist! "fuzzer_stats" will be used.')
-            with open(stats_file, 'r') as statsfile:
-                for line in statsfile.readlines():
-                    if re.search('start_time', line):
-                        target['start_time'] = int(line.split()[2])
-                        break
-            if 'start_time' not in target:
-                danger('Bad format: no "start_time" found in fuzzer_stats')
-                return False
-
-    return True
+def output_results(analyzer):
+    config = analyzer.config
+    bucket = analyzer.bucket
 
+    # the series are computed once and shared by the plot and the data files
+    crash_series = analyzer.crash_series()
 
-def main():
-    arg_parser = ArgParser(description='Analyze crash information (statistically & statically).')
-    required_args = arg_parser.add_argument_group('required arguments')
-    required_args.add_argument('-c', help='Path to the configuration json file.', required=True)
-    # arg_parser.add_argument('-v', help="Verbose", required=False)
-
-    args = arg_parser.parse_args()
-
-    info("Welcome to use the crash statistical analysis utility")
-
-    config_path = args.c
-
-    with open(config_path) as config_file:
-        config = json.load(config_file)
-        if not sanitize_config(config):
-            sys.exit(1)
-
-        if os.path.isdir(config['output_dir']):
-            warn("output dir %s exists, we will clear it this time" % config['output_dir'])
-            shutil.rmtree(config['output_dir'])
-
-        os.makedirs(config['output_dir'])
+    if config['plot_figure']:
+        with recorder.stage('plotting', 1):
+            plot_crash_over_time(config, crash_series, bucket, 1)
 
-        # default bucket margin is one hour
-        bucket_margin = 3600
-        bucket = config['bucket']
-        if bucket.lower() in ['minute', 'min', 'm']:
-            bucket_margin = 60
-        elif bucket.lower() in ['second', 'sec', 's']:
-            bucket_margin = 1
+    with recorder.stage('writing', len(crash_series)):
+        collect_crash_over_time(config, crash_series)
 
-        # key: entry group name, value: edge_no_dict
-        entry_group_dict = {}
+    if config['dedup']:
+        dedup_crash_series = analyzer.dedup_crash_series()
 
-        targets = config['targets']
-
-        for target_key in targets:
-            info("checking for %s" % target_key)
-            target = targets[target_key]
-            if not sanitize_target(target):
-                danger("skipping")
-                continue
-            start_time = int(target['start_time'])
-            group_name = target_key
-            entry_dirs = target['entry_dirs']
-
-            entries = []
-
-            # key: bin_no, value: count
-            crash_no_dict = {}
+        if config['plot_figure']:
+            with recorder.stage('plotting', 1):
+                plot_crash_over_time(config, dedup_crash_series, bucket, 2, 'dedup_crash_no_over_time',
+                                     'No of coverage-unique crashes over time')
 
-            # collect entry files first
-            for entry_dir in entry_dirs:
-                entry_files = os.listdir(entry_dir)
+        with recorder.stage('writing', len(dedup_crash_series)):
+            collect_crash_over_time(config, dedup_crash_series, 'dedup_crash')
 
-                for entry_file in entry_files:
-                    # we only check the fuzzer output file
-                    for pattern in config['entry_name_pattern']:
-                        if re.fullmatch(pattern, entry_file) is not None:
-                            entry_file = entry_dir + '/' + entry_file
+    if config['report_file'] is not None:
+        recorder.save_report(config['report_file'])
 
-                            entry_mtime = int(os.stat(entry_file).st_mtime)
 
-                            bin_no = int((entry_mtime - start_time)/bucket_margin)
+def watch_targets(analyzer):
+    """
+    Poll the crash dirs and count the new crashes as the fuzzers write them.
+    """
+    info("watching for new crashes every %ds (press Ctrl-C to stop)" % int(analyzer.config['watch_interval']))
 
-                            entry = Entry(entry_file, entry_mtime, bin_no)
+    try:
+        while True:
+            time.sleep(float(analyzer.config['watch_interval']))
 
-                            entries.append(entry)
+            if analyzer.poll() > 0:
+                try:
+                    output_results(analyzer)
+                except ValueError as error:
+                    danger(str(error))
+                    sys.exit(1)
+    except KeyboardInterrupt:
+        info("stop watching")
 
-                            break
 
-            # sort the entry file list according to creation time
-            entries.sort(key=lambda x: x.m_time, reverse=False)
+def main():
+    arg_parser = ArgParser(description='Analyze crash information (statistically & statically).')
+    required_args = arg_parser.add_argument_group('required arguments')
+    required_args.add_argument('-c', help='Path to the configuration json file.', required=True)
+    arg_parser.add_argument('-j', help='Number of parallel afl-showmap workers for dedup (overrides "workers").',
+                            type=int, required=False)
+    arg_parser.add_argument('--incremental', help='Only process the crashes added since the last run.',
+                            action='store_true', required=False)
+    arg_parser.add_argument('--watch', help='Keep running and process new crashes as they appear.',
+                            action='store_true', required=False)
+    arg_parser.add_argument('--shard', help='Only process shard i of N of the targets (e.g., 2/4), balanced by '
+                                            'entry count. The results go to output_dir/shard_i_of_N.',
+                            required=False)
+    arg_parser.add_argument('--report', help='Save the per-stage timing report (JSON) to this file.',
+                            required=False)
+    arg_parser.add_argument('--progress', help='Print the replay progress every N seconds.', type=float,
+                            metavar='N', required=False)
+    arg_parser.add_argument('--merge', help='Merge the results of all shards in output_dir into the usual outputs.',
+                            action='store_true', required=False)
+    # arg_parser.add_argument('-v', help="Verbose", required=False)
 
-            checked_entries = []
+    args = arg_parser.parse_args()
 
-            # check each entry file
-            for entry in entries:
-                checked_entries.append(entry)
-                # update the crash_no dict
-                crash_no_dict[entry.bin_no] = len(checked_entries)
-            if 0 not in crash_no_dict:
-                crash_no_dict[0]=0
-            entry_group_dict[group_name] = crash_no_dict
+    info("Welcome to use the crash statistical analysis utility")
 
-            ok("%s - Total number of unique crashes: %d" % (group_name, len(checked_entries)))
+    config_path = args.c
 
-        if bucket_margin == 3600:
-            bucket_margin = 1
-        elif bucket_margin == 1:
-            bucket_margin = 3600
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+        if args.j is not None:
+            config['workers'] = args.j
+        if args.incremental:
+            config['incremental'] = True
+        if args.watch:
+            config['watch'] = True
+        if args.report is not None:
+            config['report_file'] = args.report
+        if args.progress is not None:
+            config['progress_interval'] = args.progress
+        try:
+            analyzer = CrashAnalyzer(config)
+        except ValueError:
+            sys.exit(1)
 
-        if config['plot_figure']:
-            plot_crash_over_time(config, entry_group_dict, bucket, bucket_margin, 1)
+        if args.merge:
+            if not analyzer.merge_shards():
+                sys.exit(1)
+            try:
+                output_results(analyzer)
+            except ValueError as error:
+                danger(str(error))
+                sys.exit(1)
+            return
+
+        group_names = None
+        shard = None
+        if args.shard is not None:
+            shard = parse_shard(args.shard)
+            if shard is None:
+                danger("Invalid shard %s, expected i/N with 1 <= i <= N" % args.shard)
+                sys.exit(1)
+            if config['watch']:
+                danger("watch mode cannot be combined with --shard")
+                sys.exit(1)
+            group_names = shard_targets(config, shard[0], shard[1])
+            # every shard has its own dir in the shared output dir
+            config['output_dir'] = shard_dir_name(config['output_dir'], shard[0], shard[1])
+
+        if config['incremental']:
+            # the state files of the previous run live in the output dir
+            os.makedirs(config['output_dir'], exist_ok=True)
+        else:
+            if os.path.isdir(config['output_dir']):
+                warn("output dir %s exists, we will clear it this time" % config['output_dir'])
+                shutil.rmtree(config['output_dir'])
+
+            os.makedirs(config['output_dir'])
+
+        analyzer.run(group_names)
+
+        if shard is not None:
+            save_shard(config, 'crash', shard[0], shard[1], group_names, analyzer.group_results())
+            if config['report_file'] is not None:
+                recorder.save_report(config['report_file'])
+            return
+
+        try:
+            output_results(analyzer)
+        except ValueError as error:
+            danger(str(error))
+            sys.exit(1)
 
-        collect_crash_over_time(config, entry_group_dict, bucket_margin)
+        if config['watch']:
+            watch_targets(analyzer)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,405 @@
+import os
+import time
+
+from common_utils import *
+from target_config import *
+from showmap_runner import *
+from coverage_cache import *
+from resume_state import *
+from entry_discovery import *
+from binning import *
+from downsampling import *
+from crash_triage import *
+from sharding import *
+from instrumentation import *
+
+
+def sanitize_config(config):
+    required_params = ['output_dir', 'targets', 'entry_name_pattern', 'bucket']
+
+    for param in required_params:
+        if param not in config:
+            danger("%s is missing in the config file" % param)
+            return False
+
+    if len(config['targets']) == 0:
+        danger("No target specified")
+        return False
+
+    if config['bucket'].lower() not in valid_buckets:
+        danger("Invalid bucket unit")
+        danger("Valid units are : %s" % ' '.join(valid_buckets))
+        return False
+
+    # some amendments to config
+    if not config['output_dir'].endswith('/'):
+        config['output_dir'] += '/'
+
+    if 'plot_figure' not in config:
+        config['plot_figure'] = True
+
+    if not sanitize_downsampling(config):
+        return False
+
+    # the instrumentation report (JSON) is only written when a file is given
+    if 'report_file' not in config:
+        config['report_file'] = None
+
+    # unit is second, 0 means no progress lines
+    if 'progress_interval' not in config:
+        config['progress_interval'] = 0
+
+    if 'binary_output' not in config:
+        config['binary_output'] = False
+
+    if 'timestamp_source' not in config:
+        config['timestamp_source'] = 'mtime'
+
+    if config['timestamp_source'] not in valid_timestamp_sources:
+        danger("Invalid timestamp source")
+        danger("Valid timestamp sources are : %s" % ' '.join(valid_timestamp_sources))
+        return False
+
+    if 'incremental' not in config:
+        config['incremental'] = False
+
+    if 'watch' not in config:
+        config['watch'] = False
+
+    # unit is second
+    if 'watch_interval' not in config:
+        config['watch_interval'] = 60
+
+    if 'watch_max_entries' not in config:
+        config['watch_max_entries'] = 1000
+
+    # crash deduplication by coverage signature (requires afl-showmap)
+    if 'dedup' not in config:
+        config['dedup'] = False
+
+    if config['dedup']:
+        for param in ['showmap_command', 'showmap_output']:
+            if param not in config:
+                danger("%s is missing in the config file (required by dedup)" % param)
+                return False
+
+    if 'dedup_hit_counts' not in config:
+        config['dedup_hit_counts'] = False
+
+    if 'workers' not in config:
+        config['workers'] = 1
+
+    if int(config['workers']) < 1:
+        danger("workers should be at least 1")
+        return False
+
+    if 'showmap_mode' not in config:
+        config['showmap_mode'] = 'single'
+
+    if config['showmap_mode'] not in valid_showmap_modes:
+        danger("Invalid showmap mode")
+        danger("Valid modes are : %s" % ' '.join(valid_showmap_modes))
+        return False
+
+    if 'batch_size' not in config:
+        config['batch_size'] = 1000
+
+    if 'cache_dir' not in config:
+        config['cache_dir'] = None
+
+    # unit is MB
+    if 'cache_max_size' not in config:
+        config['cache_max_size'] = 1024
+
+    if not sanitize_showmap_settings(config):
+        return False
+
+    return True
+
+
+def init_target_state(config, group_name, target, bucket_margin):
+    signature = {
+        'entry_dirs': target['entry_dirs'],
+        'entry_name_pattern': config['entry_name_pattern'],
+        'timestamp_source': config['timestamp_source'],
+        'start_time': int(target['start_time']),
+        'bucket_margin': bucket_margin
+    }
+    if config['dedup']:
+        signature['showmap_command'] = config['showmap_command']
+        signature['dedup_hit_counts'] = config['dedup_hit_counts']
+
+    state = None
+    if config['incremental']:
+        state = load_state(config, group_name, signature)
+    if state is None:
+        state = new_state(signature)
+        state['bin_dicts'] = {'crash': {}}
+    # states saved before dedup existed have no buckets yet
+    state['bin_dicts'].setdefault('dedup_crash', {})
+    # key: coverage signature, value: first_time and crashes of the bucket
+    state.setdefault('buckets', {})
+
+    return state
+
+
+def process_entries(config, group_name, entries, state, cache):
+    """
+    Count the (new) crashes of a target and update the bins kept in the state.
+    With dedup, the crashes are also bucketed by their coverage signature.
+    """
+    # key: bin_no, value: count
+    crash_no_dict = state['bin_dicts']['crash']
+    crash_count = state['entry_count']
+    # key: bin_no, value: count of distinct signatures
+    dedup_crash_no_dict = state['bin_dicts']['dedup_crash']
+    buckets = state['buckets']
+
+    entries = filter_new_entries(entries, state)
+
+    # the failures of an earlier run (or poll) are extended, otherwise they are started from scratch
+    failures_append = crash_count > 0
+
+    signatures = None
+    if config['dedup']:
+        signatures = triage_entries(config, entries, cache)
+
+    # check each entry file
+    for entry in entries:
+        crash_count += 1
+        recorder.progress(group_name, crash_count - state['entry_count'], len(entries))
+        # update the crash_no dict
+        crash_no_dict[entry.bin_no] = crash_count
+
+        if signatures is not None:
+            signature = next(signatures)
+            if signature not in buckets:
+                buckets[signature] = {'first_time': entry.m_time, 'crashes': []}
+            buckets[signature]['crashes'].append(entry.path)
+            dedup_crash_no_dict[entry.bin_no] = len(buckets)
+    if 0 not in crash_no_dict:
+        crash_no_dict[0]=0
+    if 0 not in dedup_crash_no_dict:
+        dedup_crash_no_dict[0]=0
+
+    advance_watermark(state, entries)
+
+    if config['dedup']:
+        save_bucket_index(config, group_name, buckets)
+
+    failures = take_showmap_failures()
+    if len(failures) > 0:
+        save_showmap_failures(config, group_name, failures, failures_append)
+
+    if config['incremental']:
+        save_state(config, group_name, state)
+
+    return len(entries)
+
+
+class CrashAnalyzer:
+    """
+    In-process crash analysis of the targets of a crash config (see crash/README.md):
+
+        analyzer = CrashAnalyzer(config)
+        analyzer.run()
+        (x_vals, y_vals) = analyzer.crash_series()['afl']
+
+    The series are numpy arrays over the bins of max_span. Figures and *_time.txt files are left to
+    crash/main.py, only the files the config asks for (state, crash buckets) are written to output_dir.
+    """
+    config = None
+    bucket = ''
+    bucket_margin = 0
+    cache = None
+
+    def __init__(self, config, cache=None):
+        if not sanitize_config(config):
+            raise ValueError("invalid crash config")
+        self.config = config
+        self.bucket = config['bucket']
+        # unit is second
+        self.bucket_margin = bucket_margin_of(self.bucket)
+        recorder.progress_interval = float(config['progress_interval'])
+
+        # replays of the crashes are cached by content, so re-triage only replays new crashes
+        self.cache = cache
+        if cache is None and config['dedup'] and config['cache_dir'] is not None:
+            self.cache = CoverageCache(config['cache_dir'], config['showmap_command'],
+                                       int(config['cache_max_size']) * 1024 * 1024)
+
+        # key: entry group name, value: state of the target (see resume_state)
+        self.states = {}
+        # key: entry group name, value: crash_no_dict
+        self.entry_group_dict = {}
+        # key: entry group name, value: dedup_crash_no_dict (only with dedup)
+        self.dedup_group_dict = {}
+        # key: entry group name, value: what watch mode needs to know about the target
+        self.watched_targets = {}
+
+    def analyze_target(self, group_name):
+        """
+        Process one target of the config. Returns False if the target is skipped.
+        """
+        config = self.config
+        target = config['targets'][group_name]
+        with recorder.stage('start_time'):
+            if not sanitize_target(target):
+                return False
+        start_time = int(target['start_time'])
+
+        known_files = set() if config['watch'] else None
+        state = self.target_state(group_name)
+
+        # collect entry files first (only the ones the state has not seen)
+        with recorder.stage('scan'):
+            entries = collect_entries(config, target['entry_dirs'], start_time, self.bucket_margin, known_files,
+                                      state)
+        recorder.add_items('scan', len(entries))
+
+        return self.analyze_entries(group_name, entries, known_files, state)
+
+    def target_state(self, group_name):
+        """
+        The state of a target: the one saved by the previous run (incremental) or a fresh one.
+        """
+        return init_target_state(self.config, group_name, self.config['targets'][group_name], self.bucket_margin)
+
+    def analyze_entries(self, group_name, entries, known_files=None, state=None):
+        """
+        Count the crashes of a target which were collected already (its start_time is known).
+        known_files -- the files seen by the scan, only in watch mode
+        state -- the state of the target (see target_state) if the entries were collected with it
+        """
+        config = self.config
+        target = config['targets'][group_name]
+        if state is None:
+            state = self.target_state(group_name)
+        if state['entry_count'] > 0:
+            info("%d new crashes since the last run" % len(filter_new_entries(entries, state)), 1)
+
+        self.replay(group_name, entries, state)
+
+        self.states[group_name] = state
+        self.entry_group_dict[group_name] = state['bin_dicts']['crash']
+
+        ok("%s - Total number of unique crashes: %d" % (group_name, state['entry_count']))
+
+        if config['dedup']:
+            self.dedup_group_dict[group_name] = state['bin_dicts']['dedup_crash']
+            ok("%s - Total number of coverage-unique crashes: %d" % (group_name, len(state['buckets'])))
+
+        if config['watch']:
+            self.watched_targets[group_name] = {'target': target, 'known_files': known_files, 'pending': []}
+
+        return True
+
+    def run(self, group_names=None):
+        """
+        Analyze the targets of the config (only group_names if given, e.g., the targets of a shard).
+        """
+        os.makedirs(self.config['output_dir'], exist_ok=True)
+
+        for target_key in self.config['targets']:
+            if group_names is not None and target_key not in group_names:
+                continue
+            info("checking for %s" % target_key)
+            if not self.analyze_target(target_key):
+                danger("skipping")
+
+        if self.cache is not None:
+            self.cache.evict()
+
+        return self
+
+    def poll(self):
+        """
+        Count the crashes the fuzzers wrote since the last run/poll (watch mode).
+        At most watch_max_entries crashes are processed per target, the rest is left to the next poll.
+        Returns the number of processed crashes.
+        """
+        max_entries = int(self.config['watch_max_entries'])
+
+        processed = 0
+        for group_name in sorted(self.watched_targets.keys()):
+            watched = self.watched_targets[group_name]
+            target = watched['target']
+            watched['pending'] += collect_entries(self.config, target['entry_dirs'], int(target['start_time']),
+                                                  self.bucket_margin, watched['known_files'],
+                                                  self.states[group_name])
+            watched['pending'].sort(key=lambda x: x.m_time, reverse=False)
+
+            entries = watched['pending'][:max_entries]
+            watched['pending'] = watched['pending'][max_entries:]
+            if len(entries) == 0:
+                continue
+
+            state = self.states[group_name]
+            processed += self.replay(group_name, entries, state)
+            ok("%s - Total number of unique crashes: %d" % (group_name, state['entry_count']))
+            if self.config['dedup']:
+                ok("%s - Total number of coverage-unique crashes: %d" % (group_name, len(state['buckets'])))
+
+        return processed
+
+    def group_results(self):
+        """
+        start_time and state of every analyzed target, as saved by a shard (see sharding).
+        """
+        return dict((group_name, {'start_time': int(self.config['targets'][group_name]['start_time']),
+                                  'state': self.states[group_name]}) for group_name in self.states)
+
+    def merge_shards(self):
+        """
+        Take the results of all shards under output_dir as if their targets were analyzed here.
+        Returns False if shards are missing or do not fit the config.
+        """
+        shards = load_shards(self.config, 'crash')
+        if shards is None:
+            return False
+
+        for (shard_dir, shard) in shards:
+            info("merging shard %d/%d (%d targets)" % (shard['shard'], shard['shard_count'], len(shard['groups'])))
+            for group_name in sorted(shard['groups'].keys()):
+                if group_name not in self.config['targets']:
+                    warn("%s is not a target of the config, skipping" % group_name, 1)
+                    continue
+                group_result = shard['groups'][group_name]
+                self.config['targets'][group_name]['start_time'] = group_result['start_time']
+                state = group_result['state']
+
+                self.states[group_name] = state
+                self.entry_group_dict[group_name] = state['bin_dicts']['crash']
+                if self.config['dedup']:
+                    self.dedup_group_dict[group_name] = state['bin_dicts']['dedup_crash']
+
+                copy_shard_files(shard_dir, self.config['output_dir'], group_name,
+                                 ['_crash_buckets.json', '_showmap_failures.json'])
+
+        return True
+
+    def replay(self, group_name, entries, state):
+        recorder.target = group_name
+        started = time.perf_counter()
+        with recorder.stage('replay'):
+            processed = process_entries(self.config, group_name, entries, state, self.cache)
+        recorder.add_items('replay', processed)
+        recorder.add_target(group_name, processed, time.perf_counter() - started)
+        recorder.target = None
+        return processed
+
+    def series(self, group_dict):
+        with recorder.stage('binning', len(group_dict)):
+            return bin_series(self.config, group_dict, bins_per_hour(self.bucket_margin))
+
+    def crash_series(self):
+        return self.series(self.entry_group_dict)
+
+    def dedup_crash_series(self):
+        return self.series(self.dedup_group_dict)
+
+    def buckets(self, group_name):
+        """
+        The crash buckets of a target (only with dedup), key: coverage signature, value: first_time and crashes.
+        """
+        return self.states[group_name]['buckets']
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import numpy as np
+
+from common_utils import *
+from showmap_runner import *
+from coverage_cache import *
+
+# a crash which could not be replayed has no coverage signature, it gets a bucket of its own (by its content)
+failed_signature_prefix = 'replay_failed:'
+
+
+def crash_signature(edge_ids, edge_counts, with_hit_counts):
+    """
+    Hash of the edge set of a crash (optionally together with the AFL hit count classes reported by showmap).
+    """
+    order = np.argsort(edge_ids, kind='stable')
+    signature = hashlib.sha1(np.asarray(edge_ids, dtype='<u4')[order].tobytes())
+    if with_hit_counts:
+        signature.update(np.asarray(edge_counts, dtype=np.uint8)[order].tobytes())
+    return signature.hexdigest()
+
+
+def triage_entries(config, entries, cache):
+    """
+    Replay the crashes (in parallel, see showmap_runner) and yield the coverage signature of each one,
+    in the order of entries.
+    """
+    for (entry, (edge_ids, edge_counts)) in zip(entries, replay_entries(config, entries, cache)):
+        if replay_failed(entry.path):
+            # the empty edge set of a failed replay would merge every failed crash into one bucket
+            yield failed_signature_prefix + content_hash(entry.path)
+        else:
+            yield crash_signature(edge_ids, edge_counts, config['dedup_hit_counts'])
+
+
+def save_bucket_index(config, group_name, buckets):
+    """
+    Save the crash buckets of a target, ordered by the time their first crash was found.
+    """
+    bucket_index = []
+    for signature in sorted(buckets.keys(), key=lambda signature: buckets[signature]['first_time']):
+        bucket = buckets[signature]
+        bucket_index.append({
+            'signature': signature,
+            'first_time': bucket['first_time'],
+            'crash_no': len(bucket['crashes']),
+            'replay_failed': signature.startswith(failed_signature_prefix),
+            'crashes': bucket['crashes']
+        })
+
+    info("saving crash buckets for %s" % group_name)
+    index_file_name = config['output_dir'] + '/' + group_name + '_crash_buckets.json'
+    with open(index_file_name, 'w') as fp:
+        json.dump(bucket_index, fp, indent=2)
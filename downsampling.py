@@ -0,0 +1,92 @@
+import numpy as np
+
+from common_utils import *
+
+# "lttb": Largest-Triangle-Three-Buckets, keeps the visual shape with few points;
+# "minmax": the min and max of every column, keeps every spike; "none": plot every point
+valid_downsampling = ['lttb', 'minmax', 'none']
+
+
+def lttb_indices(x_vals, y_vals, points):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets: the first and last point, plus the point of
+    each bucket forming the largest triangle with the previously kept point and the average of the next bucket.
+    """
+    length = len(x_vals)
+    if points >= length or points < 3:
+        return np.arange(length)
+
+    x_vals = np.asarray(x_vals, dtype=np.float64)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+
+    # points - 2 buckets between the first and the last point
+    edges = np.linspace(1, length - 1, points - 1).astype(np.int64)
+    indices = np.zeros(points, dtype=np.int64)
+    indices[-1] = length - 1
+
+    kept = 0
+    for bucket_no in range(0, points - 2):
+        (start, end) = (edges[bucket_no], edges[bucket_no + 1])
+        if bucket_no + 2 < len(edges):
+            (next_start, next_end) = (edges[bucket_no + 1], edges[bucket_no + 2])
+        else:
+            (next_start, next_end) = (length - 1, length)
+        next_x = x_vals[next_start:next_end].mean()
+        next_y = y_vals[next_start:next_end].mean()
+
+        # (twice) the areas of the triangles, for every candidate of the bucket at once
+        areas = np.abs((x_vals[kept] - next_x) * (y_vals[start:end] - y_vals[kept])
+                       - (x_vals[kept] - x_vals[start:end]) * (next_y - y_vals[kept]))
+        kept = start + int(np.argmax(areas))
+        indices[bucket_no + 1] = kept
+
+    return indices
+
+
+def min_max_indices(y_vals, points):
+    """
+    Indices of the min and max point of every column ((points - 2) / 2 columns), plus the first and last point.
+    """
+    length = len(y_vals)
+    if points >= length or points < 4:
+        return np.arange(length)
+
+    y_vals = np.asarray(y_vals)
+    edges = np.linspace(0, length, int((points - 2) / 2) + 1).astype(np.int64)
+    indices = [0, length - 1]
+    for (start, end) in zip(edges[:-1].tolist(), edges[1:].tolist()):
+        if end > start:
+            indices.append(start + int(np.argmin(y_vals[start:end])))
+            indices.append(start + int(np.argmax(y_vals[start:end])))
+    return np.unique(indices)
+
+
+def downsample_indices(config, x_vals, y_vals):
+    """
+    Indices of the points to draw for a series, according to "downsampling" and "plot_points" of the config.
+    Only the plots are downsampled, the data files keep every bin.
+    """
+    if config['downsampling'] == 'lttb':
+        return lttb_indices(x_vals, y_vals, int(config['plot_points']))
+    elif config['downsampling'] == 'minmax':
+        return min_max_indices(y_vals, int(config['plot_points']))
+    return np.arange(len(x_vals))
+
+
+def sanitize_downsampling(config):
+    """
+    Defaults of the downsampling settings, shared by the sanitize_config of every plotting tool.
+    """
+    if 'downsampling' not in config:
+        config['downsampling'] = 'lttb'
+
+    if config['downsampling'] not in valid_downsampling:
+        danger("Invalid downsampling")
+        danger("Valid downsampling methods are : %s" % ' '.join(valid_downsampling))
+        return False
+
+    # at most that many points per series are drawn
+    if 'plot_points' not in config:
+        config['plot_points'] = 2000
+
+    return True
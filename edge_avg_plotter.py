@@ -3,10 +3,14 @@ import os
 import re
 import shutil
 import sys
-import matplotlib.pyplot as plt
+import numpy as np
 
 from common_utils import *
 from args import *
+from plotting import *
+from series_file import *
+from trial_aggregator import *
+from downsampling import *
 
 
 def sanitize_config(config):
@@ -28,6 +32,29 @@ def sanitize_config(config):
         danger("No target specified")
         return False
 
+    # some amendments to config
+    if 'statistic' not in config:
+        config['statistic'] = 'mean'
+
+    if config['statistic'] not in valid_statistics:
+        danger("Invalid statistic")
+        danger("Valid statistics are : %s" % ' '.join(valid_statistics))
+        return False
+
+    if 'band' not in config:
+        config['band'] = 'none'
+
+    if config['band'] not in valid_bands:
+        danger("Invalid band")
+        danger("Valid bands are : %s" % ' '.join(valid_bands))
+        return False
+
+    if 'reservoir_size' not in config:
+        config['reservoir_size'] = 64
+
+    if not sanitize_downsampling(config):
+        return False
+
     return True
 
 
@@ -65,7 +92,7 @@ def main():
 
         targets = config['targets']
 
-        # key: target name; value: average edge no
+        # key: target name; value: (x_vals, y_vals, band) of the aggregated trials
         target_edge_dict = {}
 
         for target_key in targets:
@@ -75,30 +102,31 @@ def main():
                 danger("skipping")
                 continue
 
-            data_files = target['data_files']
-            base_no = len(data_files)
-            accumulates = []
-            first_run = True
-
-            for data_file in data_files:
-                with open(data_file) as data_fd:
-                    lines = data_fd.readlines()
-                    for (i, line) in enumerate(lines):
-                        tokens = line.split(',')
-                        bin_no = int(tokens[0])
-                        edge_no = int(tokens[1])
-                        if bin_no != i+1:
-                            danger("invalid file - bin_no(%d), line_no(%d)" % (bin_no, i))
-                            sys.exit(1)
-                        if first_run:
-                            accumulates.append(edge_no)
-                        else:
-                            accumulates[i] += edge_no
-                    first_run = False
-
-            avgs = list(map(lambda acc: float(acc)/float(base_no), accumulates))
-            target_edge_dict[target_key] = avgs
-
+            # the trials are streamed one by one, only the aggregate is kept in memory
+            aggregator = TrialAggregator(int(config['reservoir_size']))
+            for data_file in target['data_files']:
+                # binary series are mapped directly, text files are only parsed for older runs
+                try:
+                    aggregator.add(load_series(data_file, config['bucket']))
+                except ValueError as error:
+                    danger(str(error))
+                    sys.exit(1)
+
+            if config['statistic'] == 'median':
+                y_vals = aggregator.median()
+            else:
+                y_vals = aggregator.mean()
+
+            band = None
+            if config['band'] == 'ci95':
+                band = aggregator.ci95()
+            elif config['band'] == 'p95':
+                band = aggregator.p95()
+
+            x_vals = np.arange(1, len(y_vals) + 1)
+            target_edge_dict[target_key] = (x_vals, y_vals, band)
+
+        plt = pyplot()
         # then we need to process the data and draw the plot
         fig = plt.figure()
         ax = fig.add_subplot(111)
@@ -108,23 +136,19 @@ def main():
         group_names.sort()
 
         for group_name in group_names:
+            (x_vals, y_vals, band) = target_edge_dict[group_name]
 
-            avgs = target_edge_dict[group_name]
-            # max_bin = max(known_bins)
-            max_bin = len(avgs)
-
-            x_vals = []
-            y_vals = []
-
-            for bin_no in range(0, max_bin):
-                x_vals.append(bin_no+1)
-                y_vals.append(avgs[bin_no])
-
-            ax.plot(x_vals, y_vals, label=group_name)
+            # only what is drawn is downsampled
+            indices = downsample_indices(config, x_vals, y_vals)
+            line = ax.plot(x_vals[indices], y_vals[indices], label=group_name)[0]
+            if band is not None:
+                ax.fill_between(x_vals[indices], band[0][indices], band[1][indices], color=line.get_color(),
+                                alpha=0.2, linewidth=0)
 
         bucket = config['bucket']
         edge_no_time_plot_filename = config['plot_file']
-        ax.set(xlabel='time (%s)' % bucket, ylabel='avg edge no #',
+        statistic_name = 'avg' if config['statistic'] == 'mean' else 'median'
+        ax.set(xlabel='time (%s)' % bucket, ylabel='%s edge no #' % statistic_name,
                title='No of edges covered over time')
         ax.grid()
         ax.legend()
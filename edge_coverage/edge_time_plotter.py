@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 import os, sys
 # TODO: deal with the dirty hack of importing
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -6,47 +5,33 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from common_utils import *
 from args import *
+from plotting import *
+from downsampling import *
 
 
-def plot_edge_over_time(config, edge_group_dict, bucket, bucket_margin, fig_no):
+def plot_edge_over_time(config, edge_series, bucket, fig_no, plot_name='edge_no_over_time', ylabel='edge no #',
+                        title='No of edges covered over time'):
+    plt = pyplot()
     # then we need to process the data and draw the plot
     fig = plt.figure(fig_no)
+    # the figure is redrawn from scratch when it is reused (e.g., in watch mode)
+    fig.clf()
     ax = fig.add_subplot(111)
 
     # sort the group names, make sure every time the order is consistent
-    group_names = list(edge_group_dict.keys())
+    group_names = list(edge_series.keys())
     group_names.sort()
 
     for group_name in group_names:
-        temp_edge_no_dict = edge_group_dict[group_name]
-
-        if 0 not in temp_edge_no_dict:
-            danger('Wrongly processed dict for %s!' % group_name)
-            sys.exit(1)
-
-        known_bins = list(temp_edge_no_dict.keys())
-        known_bins.sort()
-        # max_bin = max(known_bins)
-        max_bin = int(config['max_span']) * bucket_margin
-
-        x_vals = []
-        y_vals = []
-        
-        # log("known bins are %s" % str(known_bins))
-        # log("max_bin is %d" % max_bin)
-        for bin_no in range(0, max_bin + 1):
-            temp_bin_no = bin_no
-            while temp_bin_no not in known_bins:
-                temp_bin_no -= 1
-            calibrated_bin_no = bin_no + 1
-            x_vals.append(calibrated_bin_no)
-            y_vals.append(temp_edge_no_dict[temp_bin_no])
-
-        ax.plot(x_vals, y_vals, label=group_name)
-
-    edge_no_time_plot_filename = config['output_dir'] + '/' + "edge_no_over_time"
-    ax.set(xlabel='time (%s)' % bucket, ylabel='edge no #',
-           title='No of edges covered over time')
+        (x_vals, y_vals) = edge_series[group_name]
+
+        # only what is drawn is downsampled, the data files keep every bin
+        indices = downsample_indices(config, x_vals, y_vals)
+        ax.plot(x_vals[indices], y_vals[indices], label=group_name)
+
+    edge_no_time_plot_filename = config['output_dir'] + '/' + plot_name
+    ax.set(xlabel='time (%s)' % bucket, ylabel=ylabel,
+           title=title)
     ax.grid()
     ax.legend()
 
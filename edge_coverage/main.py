@@ -1,9 +1,8 @@
 import json
 import os
-import re
 import shutil
-import subprocess
 import sys
+import time
 
 # TODO: deal with the dirty hack of importing
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,84 +10,69 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from common_utils import *
 from args import *
-from entry import *
 from edge_time_plotter import *
 from entry_time_plotter import *
 from data_collector import *
+from coverage_analyzer import *
 
 
-def sanitize_config(config):
-    required_params = ['showmap_command', 'targets', 'showmap_output', 'output_dir', 'entry_name_pattern', 'bucket']
-
-    valid_buckets = ['second', 'minute', 'hour', 'sec', 'min', 'hour', 's', 'm', 'h']
-
-    for param in required_params:
-        if param not in config:
-            danger("%s is missing in the config file" % param)
-            return False
-
-    if len(config['targets']) == 0:
-        danger("No target specified")
-        return False
-
-    if config['bucket'].lower() not in valid_buckets:
-        danger("Invalid bucket unit")
-        danger("Valid units are : %s" % ' '.join(valid_buckets))
-        return False
-
-    # some amendments to config
-    if not config['output_dir'].endswith('/'):
-        config['output_dir'] += '/'
-
-    if 'plot_figure' not in config:
-        config['plot_figure'] = True
-
-    return True
-
-
-def sanitize_target(target):
-    required_params = ['entry_dirs']
-
-    for param in required_params:
-        if param not in target:
-            danger("%s is missing in target")
-            return False
-
-    if len(target['entry_dirs']) == 0:
-        danger('No entry dir specified for target')
-        return False
-
-    else:
-        # fuzzy finding
-        fuzzy_stats_loc = ['/../fuzzer_stats', '/fuzzer_stats']
-        stats_file_found = False
-        stats_file = None
-        for entry_dir in target['entry_dirs']:
-            for stats_loc in fuzzy_stats_loc:
-                stats_file = os.path.abspath(entry_dir) + stats_loc
-                if os.path.isfile(stats_file):
-                    stats_file_found = True
-                    break
-            if stats_file_found:
-                break
-
-        if not stats_file_found and 'start_time' not in target:
-            danger('Neither start_time or fuzzer_stats found')
-            return False
-        elif stats_file_found:
-            # coexistence allowed but warn user
-            if 'start_time' in target:
-                warn('Warning: both "start_time" and fuzzer_stats file exist! "fuzzer_stats" will be used.')
-            with open(stats_file, 'r') as statsfile:
-                for line in statsfile.readlines():
-                    if re.search('start_time', line):
-                        target['start_time'] = int(line.split()[2])
-                        break
-            if 'start_time' not in target:
-                danger('Bad format: no "start_time" found in fuzzer_stats')
-                return False
-
-    return True
+def output_results(analyzer):
+    config = analyzer.config
+    bucket = analyzer.bucket
+
+    # the series are computed once and shared by the plots and the data files
+    edge_series = analyzer.edge_series()
+    entry_series = analyzer.entry_series()
+
+    if config['plot_figure']:
+        with recorder.stage('plotting', 2):
+            plot_edge_over_time(config, edge_series, bucket, 1)
+            plot_entry_over_time(config, entry_series, bucket, 2)
+
+    with recorder.stage('writing', 2 * len(edge_series)):
+        collect_entry_over_time(config, entry_series)
+        collect_edge_over_time(config, edge_series)
+
+    if config['data_source'] == 'plot_data':
+        crash_series = analyzer.crash_series()
+        with recorder.stage('writing', len(crash_series)):
+            collect_series_over_time(config, crash_series, 'crash')
+
+    if config['tuple_coverage']:
+        tuple_series = analyzer.tuple_series()
+        if config['plot_figure']:
+            with recorder.stage('plotting', 1):
+                plot_edge_over_time(config, tuple_series, bucket, 3, 'tuple_no_over_time', 'tuple no #',
+                                    'No of (edge, hit count class) tuples covered over time')
+        with recorder.stage('writing', len(tuple_series)):
+            collect_series_over_time(config, tuple_series, 'tuple')
+
+    if config['compare'] and len(analyzer.states) > 0:
+        with recorder.stage('comparison'):
+            write_comparison(config, analyzer.compare())
+
+    if config['report_file'] is not None:
+        recorder.save_report(config['report_file'])
+
+
+def watch_targets(analyzer):
+    """
+    Poll the entry dirs and replay the new entries as the fuzzers write them.
+    """
+    info("watching for new entries every %ds (press Ctrl-C to stop)" % int(analyzer.config['watch_interval']))
+
+    try:
+        while True:
+            time.sleep(float(analyzer.config['watch_interval']))
+
+            if analyzer.poll() > 0:
+                try:
+                    output_results(analyzer)
+                except ValueError as error:
+                    danger(str(error))
+                    sys.exit(1)
+    except KeyboardInterrupt:
+        info("stop watching")
 
 
 @timed
@@ -96,6 +80,21 @@ def main():
     arg_parser = ArgParser(description='Analyze edge coverage.')
     required_args = arg_parser.add_argument_group('required arguments')
     required_args.add_argument('-c', help='Path to the configuration json file.', required=True)
+    arg_parser.add_argument('-j', help='Number of parallel afl-showmap workers (overrides "workers").',
+                            type=int, required=False)
+    arg_parser.add_argument('--incremental', help='Only replay the entries added since the last run.',
+                            action='store_true', required=False)
+    arg_parser.add_argument('--watch', help='Keep running and replay new entries as they appear.',
+                            action='store_true', required=False)
+    arg_parser.add_argument('--shard', help='Only process shard i of N of the targets (e.g., 2/4), balanced by '
+                                            'entry count. The results go to output_dir/shard_i_of_N.',
+                            required=False)
+    arg_parser.add_argument('--report', help='Save the per-stage timing report (JSON) to this file.',
+                            required=False)
+    arg_parser.add_argument('--progress', help='Print the replay progress every N seconds.', type=float,
+                            metavar='N', required=False)
+    arg_parser.add_argument('--merge', help='Merge the results of all shards in output_dir into the usual outputs.',
+                            action='store_true', required=False)
     # arg_parser.add_argument('-v', help="Verbose", required=False)
 
     args = arg_parser.parse_args()
@@ -106,124 +105,71 @@ def main():
 
     with open(config_path) as config_file:
         config = json.load(config_file)
-        if not sanitize_config(config):
+        if args.j is not None:
+            config['workers'] = args.j
+        if args.incremental:
+            config['incremental'] = True
+        if args.watch:
+            config['watch'] = True
+        if args.report is not None:
+            config['report_file'] = args.report
+        if args.progress is not None:
+            config['progress_interval'] = args.progress
+        try:
+            analyzer = CoverageAnalyzer(config)
+        except ValueError:
             sys.exit(1)
 
-        if os.path.isdir(config['output_dir']):
-            warn("output dir %s exists, we will clear it this time" % config['output_dir'])
-            shutil.rmtree(config['output_dir'])
-
-        os.makedirs(config['output_dir'])
-
-        base_command = config['showmap_command'].replace('##', config['showmap_output'])
-
-        # default bucket margin is one hour
-        bucket_margin = 3600
-        bucket = config['bucket']
-        if bucket.lower() in ['minute', 'min', 'm']:
-            bucket_margin = 60
-        elif bucket.lower() in ['second', 'sec', 's']:
-            bucket_margin = 1
-
-        # key: entry group name, value: edge_no_dict
-        edge_group_dict = {}
-        # key: entry group name, value: entry_no_dict
-        entry_group_dict = {}
-
-        targets = config['targets']
-
-        for target_key in targets:
-            info("checking for %s" % target_key)
-            target = targets[target_key]
-            if not sanitize_target(target):
-                danger("skipping")
-                continue
-            start_time = int(target['start_time'])
-            group_name = target_key
-            entry_dirs = target['entry_dirs']
-
-            covered_edges = set()
-
-            entries = []
-
-            # key: bin_no, value: edge count
-            edge_no_dict = {}
-            # key: bin_no, value: entry count
-            entry_no_dict = {}
-
-            # collect entry files first
-            for entry_dir in entry_dirs:
-                entry_files = os.listdir(entry_dir)
-
-                for entry_file in entry_files:
-                    # we only check the fuzzer output file
-                    for pattern in config['entry_name_pattern']:
-                        if re.fullmatch(pattern, entry_file) is not None:
-                            entry_file = entry_dir + '/' + entry_file
-
-                            entry_mtime = int(os.stat(entry_file).st_mtime)
-
-                            bin_no = int((entry_mtime - start_time)/bucket_margin)
-
-                            entry = Entry(entry_file, entry_mtime, bin_no)
-
-                            entries.append(entry)
-
-                            break
-
-            # sort the entry file list according to creation time
-            entries.sort(key=lambda x: x.m_time, reverse=False)
-
-            checked_entries = []
-
-            # check each entry file
-            for entry in entries:
-                # info("checking %s -- %d" % (entry.path, entry.m_time), 1)
-
-                temp_command = base_command.replace('@@', entry.path)
-                proc = subprocess.Popen(temp_command.split(' '), stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-                proc.communicate()
-
-                with open(config['showmap_output']) as showmap_output_file:
-                    lines = showmap_output_file.readlines()
-                    for line in lines:
-                        try:
-                            edge_id = int(line.split(':')[0])
-                            edge_count = int(line.split(':')[1])
-                            covered_edges.add(edge_id)
-                        except IndexError:
-                            warn("cannot handle showmap output line: %s" % line, 1)
-
-                # update the edge_no dict
-                # NOTE: temporarily no difference
-                checked_entries.append(entry)
-                entry_no_dict[entry.bin_no] = len(checked_entries)
-
-                if entry.bin_no not in edge_no_dict:
-                    edge_no_dict[entry.bin_no] = len(covered_edges)
-                else:
-                    edge_no_dict[entry.bin_no] = len(covered_edges)
-
-            if 0 not in edge_no_dict:
-                edge_no_dict[0]= 0
-            if 0 not in entry_no_dict:
-                entry_no_dict[0]= 0
-            edge_group_dict[group_name] = edge_no_dict
-            entry_group_dict[group_name] = entry_no_dict
-            ok("%s - Total number of covered edges: %d" % (group_name, len(covered_edges)))
-            ok("%s - Total number of entries: %d" % (group_name, len(checked_entries)))
-
-        if bucket_margin == 3600:
-            bucket_margin = 1
-        elif bucket_margin == 1:
-            bucket_margin = 3600
-
-        if config['plot_figure']:
-            plot_edge_over_time(config, edge_group_dict, bucket, bucket_margin, 1)
-            plot_entry_over_time(config, entry_group_dict, bucket, bucket_margin, 2)
+        if args.merge:
+            if not analyzer.merge_shards():
+                sys.exit(1)
+            try:
+                output_results(analyzer)
+            except ValueError as error:
+                danger(str(error))
+                sys.exit(1)
+            return
+
+        group_names = None
+        shard = None
+        if args.shard is not None:
+            shard = parse_shard(args.shard)
+            if shard is None:
+                danger("Invalid shard %s, expected i/N with 1 <= i <= N" % args.shard)
+                sys.exit(1)
+            if config['watch']:
+                danger("watch mode cannot be combined with --shard")
+                sys.exit(1)
+            group_names = shard_targets(config, shard[0], shard[1])
+            # every shard has its own dir in the shared output dir
+            config['output_dir'] = shard_dir_name(config['output_dir'], shard[0], shard[1])
+
+        if config['incremental']:
+            # the state files of the previous run live in the output dir
+            os.makedirs(config['output_dir'], exist_ok=True)
+        else:
+            if os.path.isdir(config['output_dir']):
+                warn("output dir %s exists, we will clear it this time" % config['output_dir'])
+                shutil.rmtree(config['output_dir'])
+
+            os.makedirs(config['output_dir'])
+
+        analyzer.run(group_names)
+
+        if shard is not None:
+            save_shard(config, 'edge_coverage', shard[0], shard[1], group_names, analyzer.group_results())
+            if config['report_file'] is not None:
+                recorder.save_report(config['report_file'])
+            return
+
+        try:
+            output_results(analyzer)
+        except ValueError as error:
+            danger(str(error))
+            sys.exit(1)
 
-        collect_entry_over_time(config, entry_group_dict, bucket_margin)
-        collect_edge_over_time(config, edge_group_dict, bucket_margin)
+        if config['watch']:
+            watch_targets(analyzer)
 
 
 if __name__ == "__main__":
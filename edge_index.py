@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import numpy as np
+
+from common_utils import *
+from args import *
+
+# one row per covered edge: the first time (seconds since the fuzzer started) and the entry that reached it
+edge_index_dtype = np.dtype([('edge', '<u4'), ('rel_time', '<i8'), ('entry', '<u4')])
+
+
+def edge_index_file_name(output_dir, group_name):
+    return os.path.join(output_dir, group_name + '_edge_index.npy')
+
+
+def entry_index_file_name(output_dir, group_name):
+    return os.path.join(output_dir, group_name + '_edge_index_entries.txt')
+
+
+def new_edge_rows(new_edge_ids, rel_time, entry_no):
+    rows = np.zeros(len(new_edge_ids), dtype=edge_index_dtype)
+    rows['edge'] = new_edge_ids
+    rows['rel_time'] = rel_time
+    rows['entry'] = entry_no
+    return rows
+
+
+def save_edge_index(output_dir, group_name, rows, contributions, append):
+    """
+    Save (or extend, when append is set) the first-discovery index of a group.
+    rows is a list of edge_index_dtype arrays, contributions are (entry_no, m_time, new edge no, path) of the entries
+    which covered new edges.
+    """
+    index_file = edge_index_file_name(output_dir, group_name)
+    if append and os.path.isfile(index_file):
+        rows = [np.load(index_file)] + rows
+    rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=edge_index_dtype)
+    # sorted by edge id, so that lookups are a binary search
+    rows = rows[np.argsort(rows['edge'], kind='stable')]
+    np.save(index_file, rows)
+
+    with open(entry_index_file_name(output_dir, group_name), 'a' if append else 'w') as fp:
+        for (entry_no, m_time, new_edge_no, path) in contributions:
+            fp.write('%d,%d,%d,%s\n' % (entry_no, m_time, new_edge_no, path))
+
+
+def load_edge_index(output_dir, group_name):
+    return np.load(edge_index_file_name(output_dir, group_name), mmap_mode='r')
+
+
+def first_reach(edge_indexes, edge_id):
+    """
+    When did each group first reach edge_id (seconds since its start)? None if it never did.
+    edge_indexes -- key: group name, value: loaded edge index
+    """
+    reached = {}
+    for group_name in sorted(edge_indexes.keys()):
+        rows = edge_indexes[group_name]
+        position = np.searchsorted(rows['edge'], edge_id)
+        if position < len(rows) and rows['edge'][position] == edge_id:
+            reached[group_name] = int(rows['rel_time'][position])
+        else:
+            reached[group_name] = None
+    return reached
+
+
+def edges_only_in(edge_index_a, edge_index_b):
+    """
+    Edges reached by a but never by b.
+    """
+    return np.setdiff1d(edge_index_a['edge'], edge_index_b['edge'], assume_unique=True)
+
+
+def contributing_entries(output_dir, group_name):
+    """
+    The entries which covered new edges: (entry_no, m_time, new edge no, path), in discovery order.
+    """
+    contributions = []
+    with open(entry_index_file_name(output_dir, group_name)) as fp:
+        for line in fp:
+            tokens = line.rstrip('\n').split(',', 3)
+            contributions.append((int(tokens[0]), int(tokens[1]), int(tokens[2]), tokens[3]))
+    return contributions
+
+
+def main():
+    arg_parser = ArgParser(description='Query the edge first-discovery index written by edge_coverage/main.py.')
+    required_args = arg_parser.add_argument_group('required arguments')
+    required_args.add_argument('-d', help='The output_dir of the edge coverage analysis.', required=True)
+    arg_parser.add_argument('--first', help='When did each group first reach this edge.', type=int, required=False)
+    arg_parser.add_argument('--only', help='Edges reached by group A but never by group B.', nargs=2,
+                            metavar=('A', 'B'), required=False)
+    arg_parser.add_argument('--entries', help='Entries of a group which contributed new edges.',
+                            metavar='GROUP', required=False)
+
+    args = arg_parser.parse_args()
+
+    suffix = '_edge_index.npy'
+    group_names = sorted(file_name[:-len(suffix)] for file_name in os.listdir(args.d) if file_name.endswith(suffix))
+    if len(group_names) == 0:
+        danger("No edge index found in %s" % args.d)
+        sys.exit(1)
+
+    if args.first is not None:
+        edge_indexes = dict((group_name, load_edge_index(args.d, group_name)) for group_name in group_names)
+        for (group_name, rel_time) in first_reach(edge_indexes, args.first).items():
+            log("%s: %s" % (group_name, 'never' if rel_time is None else '%ds' % rel_time))
+
+    if args.only is not None:
+        for group_name in args.only:
+            if group_name not in group_names:
+                danger("No edge index for %s" % group_name)
+                sys.exit(1)
+        only_edges = edges_only_in(load_edge_index(args.d, args.only[0]), load_edge_index(args.d, args.only[1]))
+        info("%d edges reached by %s but never by %s" % (len(only_edges), args.only[0], args.only[1]))
+        log(json.dumps(only_edges.tolist()))
+
+    if args.entries is not None:
+        for (entry_no, m_time, new_edge_no, path) in contributing_entries(args.d, args.entries):
+            log("%d,%d,%d,%s" % (entry_no, m_time, new_edge_no, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from common_utils import *
+from entry import *
+
+# sorted (by mtime) view of the discovered entries, path_index points into the list of paths
+entry_dtype = np.dtype([('m_time', np.int64), ('path_index', np.uint32)])
+
+# at most that many entry dirs are scanned at the same time
+max_scan_workers = 8
+
+# "mtime": stat every entry; "filename": AFL++ "time:<ms>" in the entry name (no stat at all);
+# "filename_mtime": the name if it has a time, mtime otherwise
+valid_timestamp_sources = ['mtime', 'filename', 'filename_mtime']
+
+# AFL++ writes the time (ms since the fuzzer started) into queue/crash/hang names, e.g., id:000042,time:1234,...
+name_time_pattern = re.compile(r'(?:^|,)time:(\d+)')
+
+
+def compile_entry_patterns(patterns):
+    """
+    Compile all entry name patterns into a single alternation, matched once per file name.
+    """
+    return re.compile('|'.join('(?:%s)' % pattern for pattern in patterns))
+
+
+def scan_entry_dir(entry_dir, entry_pattern, known_files=None, timestamp_source='mtime', start_time=0):
+    """
+    Scan one entry dir. Returns the paths and timestamps of the matching files, plus the paths
+    of all files seen for the first time (to be added to known_files by the caller).
+    """
+    entry_paths = []
+    entry_mtimes = []
+    new_files = []
+    unnamed_no = 0
+
+    with os.scandir(entry_dir) as dir_entries:
+        for dir_entry in dir_entries:
+            entry_file = entry_dir + '/' + dir_entry.name
+            if known_files is not None:
+                if entry_file in known_files:
+                    continue
+                new_files.append(entry_file)
+
+            # we only check the fuzzer output file
+            if entry_pattern.fullmatch(dir_entry.name) is None:
+                continue
+
+            if timestamp_source != 'mtime':
+                name_time = name_time_pattern.search(dir_entry.name)
+                if name_time is not None:
+                    entry_paths.append(entry_file)
+                    entry_mtimes.append(start_time + int(int(name_time.group(1)) / 1000))
+                    continue
+                if timestamp_source == 'filename':
+                    unnamed_no += 1
+                    continue
+
+            entry_paths.append(entry_file)
+            entry_mtimes.append(int(dir_entry.stat().st_mtime))
+
+    if unnamed_no > 0:
+        warn("%d entries in %s have no time in their names and are skipped" % (unnamed_no, entry_dir), 1)
+
+    return entry_paths, entry_mtimes, new_files
+
+
+def discover_entries(entry_dirs, patterns, known_files=None, timestamp_source='mtime', start_time=0):
+    """
+    Discover the entry files of all entry dirs (scanned in parallel).
+    Files in known_files are skipped and the new ones are added to it.
+    Timestamps taken from the file names are relative to start_time.
+    Returns the list of paths and an entry_dtype array sorted by timestamp.
+    """
+    entry_pattern = compile_entry_patterns(patterns)
+
+    def scan(entry_dir):
+        return scan_entry_dir(entry_dir, entry_pattern, known_files, timestamp_source, start_time)
+
+    if len(entry_dirs) == 0:
+        # e.g., an AFL output dir without hangs/
+        results = []
+    elif len(entry_dirs) == 1:
+        results = [scan(entry_dirs[0])]
+    else:
+        with ThreadPoolExecutor(min(len(entry_dirs), max_scan_workers)) as executor:
+            results = list(executor.map(scan, entry_dirs))
+
+    entry_paths = []
+    entry_mtimes = []
+    for (dir_paths, dir_mtimes, new_files) in results:
+        entry_paths += dir_paths
+        entry_mtimes += dir_mtimes
+        if known_files is not None:
+            known_files.update(new_files)
+
+    entry_table = np.zeros(len(entry_paths), dtype=entry_dtype)
+    entry_table['m_time'] = entry_mtimes
+    entry_table['path_index'] = np.arange(len(entry_paths))
+    entry_table = entry_table[np.argsort(entry_table['m_time'], kind='stable')]
+
+    return entry_paths, entry_table
+
+
+def entry_bins(entry_table, start_time, bucket_margin):
+    # same as int((m_time - start_time) / bucket_margin), i.e., rounded towards zero
+    return np.trunc((entry_table['m_time'] - start_time) / float(bucket_margin)).astype(np.int64)
+
+
+def filter_new_table(entry_table, entry_paths, state):
+    """
+    The rows of entry_table which are not processed yet according to the watermark of the state
+    (same rule as resume_state.filter_new_entries).
+    """
+    watermark = state['watermark']
+    keep = entry_table['m_time'] >= watermark
+    at_watermark = np.flatnonzero(entry_table['m_time'] == watermark)
+    if len(at_watermark) > 0:
+        watermark_paths = set(state['watermark_paths'])
+        keep[at_watermark] = [entry_paths[path_index] not in watermark_paths
+                              for path_index in entry_table['path_index'][at_watermark].tolist()]
+    return entry_table[keep]
+
+
+def collect_entries(config, entry_dirs, start_time, bucket_margin, known_files=None, state=None):
+    """
+    Collect the entry files of a target as Entry objects, sorted by timestamp.
+    Files in known_files are skipped (and new ones are added to it), so only new files are stat'ed.
+    With the state of a previous run, Entry objects are only built for the entries past its watermark.
+    """
+    (entry_paths, entry_table) = discover_entries(entry_dirs, config['entry_name_pattern'], known_files,
+                                                  config['timestamp_source'], start_time)
+    if state is not None:
+        entry_table = filter_new_table(entry_table, entry_paths, state)
+    bin_nos = entry_bins(entry_table, start_time, bucket_margin)
+
+    return [Entry(entry_paths[path_index], m_time, bin_no) for (m_time, path_index, bin_no)
+            in zip(entry_table['m_time'].tolist(), entry_table['path_index'].tolist(), bin_nos.tolist())]
+
+
+def count_entries(entry_dirs, patterns):
+    """
+    Number of entry files of a target, without stat'ing them (e.g., to balance shards).
+    """
+    entry_pattern = compile_entry_patterns(patterns)
+    entry_no = 0
+    for entry_dir in entry_dirs:
+        try:
+            with os.scandir(entry_dir) as dir_entries:
+                for dir_entry in dir_entries:
+                    if entry_pattern.fullmatch(dir_entry.name) is not None:
+                        entry_no += 1
+        except OSError:
+            warn("cannot scan %s" % entry_dir, 1)
+    return entry_no
@@ -0,0 +1,127 @@
+import contextlib
+import json
+import resource
+import time
+import numpy as np
+
+from common_utils import *
+
+
+def children_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageRecorder:
+    """
+    Wall and CPU time of the stages of the pipeline (scan, start_time, showmap_spawn, showmap_wait, parse, ...),
+    plus the afl-showmap latency of every entry per target.
+    The CPU time of a stage is the time of this process plus the time of the child processes it waited for
+    (e.g., afl-showmap). Pool workers record into their own recorder, which is drained and merged by the parent.
+    """
+    target = None
+    progress_interval = 0
+
+    def __init__(self):
+        # key: stage name, value: [calls, wall, cpu, items]
+        self.stages = {}
+        # key: target, value: showmap latencies (seconds) of the entries
+        self.latencies = {}
+        # key: target, value: [entries, wall] of the replay
+        self.targets = {}
+        self.target = None
+        # no progress lines unless enabled
+        self.progress_interval = 0
+        self.last_progress = 0
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+
+    def record(self, name, wall, cpu, items=0):
+        stage = self.stages.setdefault(name, [0, 0.0, 0.0, 0])
+        stage[0] += 1
+        stage[1] += wall
+        stage[2] += cpu
+        stage[3] += items
+
+    @contextlib.contextmanager
+    def stage(self, name, items=0):
+        started = time.perf_counter()
+        started_cpu = time.process_time() + children_cpu_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, time.process_time() + children_cpu_time() - started_cpu,
+                        items)
+
+    def add_items(self, name, items):
+        self.stages.setdefault(name, [0, 0.0, 0.0, 0])[3] += items
+
+    def add_latency(self, seconds):
+        self.latencies.setdefault(self.target, []).append(seconds)
+
+    def add_target(self, group_name, entry_no, wall):
+        target = self.targets.setdefault(group_name, [0, 0.0])
+        target[0] += entry_no
+        target[1] += wall
+
+    def drain(self):
+        """
+        Take the measurements recorded so far (in a pool worker), to be merged into the parent's recorder.
+        """
+        measurements = (self.stages, self.latencies.get(self.target, []))
+        self.stages = {}
+        self.latencies = {}
+        return measurements
+
+    def merge(self, measurements):
+        (stages, latencies) = measurements
+        for (name, (calls, wall, cpu, items)) in stages.items():
+            stage = self.stages.setdefault(name, [0, 0.0, 0.0, 0])
+            stage[0] += calls
+            stage[1] += wall
+            stage[2] += cpu
+            stage[3] += items
+        self.latencies.setdefault(self.target, []).extend(latencies)
+
+    def progress(self, group_name, done, total):
+        if self.progress_interval <= 0:
+            return
+        now = time.perf_counter()
+        if now - self.last_progress < self.progress_interval and done < total:
+            return
+        self.last_progress = now
+        info("%s: %d/%d entries replayed" % (group_name, done, total), 1)
+
+    def report(self):
+        stages = {}
+        for (name, (calls, wall, cpu, items)) in sorted(self.stages.items()):
+            stages[name] = {'calls': calls, 'wall': wall, 'cpu': cpu, 'items': items,
+                            'items_per_sec': items / wall if items > 0 and wall > 0 else None}
+
+        targets = {}
+        for group_name in sorted(set(self.targets.keys()) | set(key for key in self.latencies if key is not None)):
+            (entry_no, wall) = self.targets.get(group_name, [0, 0.0])
+            targets[group_name] = {'entries': entry_no, 'wall': wall,
+                                   'entries_per_sec': entry_no / wall if wall > 0 else None}
+            latencies = self.latencies.get(group_name, [])
+            if len(latencies) > 0:
+                (p50, p90, p99) = np.percentile(latencies, [50, 90, 99]).tolist()
+                targets[group_name]['showmap_latency'] = {'count': len(latencies), 'mean': float(np.mean(latencies)),
+                                                          'p50': p50, 'p90': p90, 'p99': p99,
+                                                          'max': float(np.max(latencies))}
+
+        return {
+            'wall': time.perf_counter() - self.started,
+            'cpu': time.process_time() - self.started_cpu + children_cpu_time(),
+            'stages': stages,
+            'targets': targets
+        }
+
+    def save_report(self, report_file):
+        with open(report_file, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+        info("instrumentation report saved to %s" % report_file)
+
+
+# the recorder of this process
+recorder = StageRecorder()
@@ -0,0 +1,210 @@
+import os
+
+from common_utils import *
+from target_config import *
+from entry_discovery import *
+from binning import *
+from instrumentation import *
+from coverage_analyzer import CoverageAnalyzer
+from crash_analyzer import CrashAnalyzer
+
+# the sub dirs of an AFL output dir, each one analyzed like its own tool would do
+afl_output_kinds = ['queue', 'crashes', 'hangs']
+
+
+def expand_afl_dirs(config):
+    """
+    A target whose afl_dir is the output root of a parallel campaign (-M/-S) becomes one target per instance,
+    named <target>_<instance>. The instances keep the target as "fuzzer", so they are compared as its trials.
+    """
+    targets = {}
+    for group_name in config['targets']:
+        target = config['targets'][group_name]
+        if 'afl_dir' not in target:
+            danger("afl_dir is missing in target %s" % group_name)
+            return False
+        afl_dir = target['afl_dir']
+        if os.path.isdir(os.path.join(afl_dir, 'queue')):
+            targets[group_name] = target
+            continue
+
+        instances = sorted(dir_name for dir_name in os.listdir(afl_dir)
+                           if os.path.isdir(os.path.join(afl_dir, dir_name, 'queue'))) \
+            if os.path.isdir(afl_dir) else []
+        if len(instances) == 0:
+            danger("%s is not an AFL output dir" % afl_dir)
+            return False
+        for instance in instances:
+            instance_target = dict(target)
+            instance_target['afl_dir'] = os.path.join(afl_dir, instance)
+            instance_target.setdefault('fuzzer', group_name)
+            targets[group_name + '_' + instance] = instance_target
+        info("%s: %d fuzzer instances" % (group_name, len(instances)), 1)
+
+    config['targets'] = targets
+    return True
+
+
+def sanitize_config(config):
+    required_params = ['targets', 'output_dir', 'entry_name_pattern', 'bucket', 'showmap_command', 'showmap_output']
+
+    for param in required_params:
+        if param not in config:
+            danger("%s is missing in the config file" % param)
+            return False
+
+    if len(config['targets']) == 0:
+        danger("No target specified")
+        return False
+
+    if config.get('data_source', 'showmap') != 'showmap':
+        danger("the AFL output dir analyzer replays the queue with afl-showmap, data_source is not supported")
+        return False
+
+    if config.get('watch', False):
+        warn("watch mode is not supported by the AFL output dir analyzer, use the edge coverage or crash analyzer")
+        config['watch'] = False
+
+    # some amendments to config
+    if not config['output_dir'].endswith('/'):
+        config['output_dir'] += '/'
+
+    if 'hangs' not in config:
+        config['hangs'] = True
+
+    return expand_afl_dirs(config)
+
+
+def kind_config(config, kind):
+    """
+    The config of the analyzer of one sub dir: the same settings, the sub dir of every AFL output dir as entry dir,
+    and output_dir/<kind>/ for its side files (state, edge index, crash buckets, showmap failures).
+    """
+    sub_config = dict((key, value) for (key, value) in config.items() if key not in ['targets', 'output_dir'])
+    sub_config['output_dir'] = config['output_dir'] + kind + '/'
+    sub_config['targets'] = {}
+    for group_name in config['targets']:
+        target = dict((key, value) for (key, value) in config['targets'][group_name].items() if key != 'afl_dir')
+        target['entry_dirs'] = [os.path.join(config['targets'][group_name]['afl_dir'], kind)]
+        sub_config['targets'][group_name] = target
+    if kind == 'hangs':
+        # replaying a hang costs a whole timeout, they are only counted
+        sub_config['dedup'] = False
+    return sub_config
+
+
+class OutputDirAnalyzer:
+    """
+    Single pass analysis of AFL output dirs (see afl_output/README.md): fuzzer_stats is read once per target,
+    queue/, crashes/ and hangs/ are scanned once each, and the entries are handed to the edge coverage and
+    crash analyzers:
+
+        analyzer = OutputDirAnalyzer(config)
+        analyzer.run()
+        (x_vals, y_vals) = analyzer.edge_series()['afl']
+
+    Figures and *_time.txt files are left to afl_output/main.py.
+    """
+    config = None
+    bucket = ''
+    bucket_margin = 0
+
+    def __init__(self, config, cache=None):
+        if not sanitize_config(config):
+            raise ValueError("invalid AFL output dir config")
+        self.config = config
+        self.bucket = config['bucket']
+        # unit is second
+        self.bucket_margin = bucket_margin_of(self.bucket)
+
+        self.queue = CoverageAnalyzer(kind_config(config, 'queue'), cache)
+        # one coverage cache for the queue and the crashes
+        self.crashes = CrashAnalyzer(kind_config(config, 'crashes'), self.queue.cache)
+        self.hangs = CrashAnalyzer(kind_config(config, 'hangs'), self.queue.cache) if config['hangs'] else None
+
+        # the defaults of both tools (plot_figure, binary_output, dedup, ...) apply to the outputs as well
+        for analyzer in [self.queue, self.crashes]:
+            for (key, value) in analyzer.config.items():
+                config.setdefault(key, value)
+
+        # key: entry group name, value: fields of its fuzzer_stats
+        self.fuzzer_stats = {}
+
+    def analyzers(self):
+        analyzers = [('queue', self.queue), ('crashes', self.crashes)]
+        if self.hangs is not None:
+            analyzers.append(('hangs', self.hangs))
+        return analyzers
+
+    def analyze_target(self, group_name):
+        """
+        Process one AFL output dir. Returns False if the target is skipped.
+        """
+        target = self.config['targets'][group_name]
+        stats_file = os.path.join(target['afl_dir'], 'fuzzer_stats')
+        with recorder.stage('start_time'):
+            if os.path.isfile(stats_file):
+                self.fuzzer_stats[group_name] = read_fuzzer_stats(stats_file)
+                if 'start_time' in self.fuzzer_stats[group_name]:
+                    target['start_time'] = int(self.fuzzer_stats[group_name]['start_time'])
+            if 'start_time' not in target:
+                danger('Neither start_time or fuzzer_stats found')
+                return False
+        start_time = int(target['start_time'])
+
+        kind_entries = {}
+        kind_states = {}
+        with recorder.stage('scan'):
+            for (kind, analyzer) in self.analyzers():
+                analyzer.config['targets'][group_name]['start_time'] = start_time
+                entry_dirs = [entry_dir for entry_dir in analyzer.config['targets'][group_name]['entry_dirs']
+                              if os.path.isdir(entry_dir)]
+                if len(entry_dirs) == 0:
+                    warn("no %s dir in %s" % (kind, target['afl_dir']), 1)
+                kind_states[kind] = analyzer.target_state(group_name)
+                kind_entries[kind] = collect_entries(analyzer.config, entry_dirs, start_time, self.bucket_margin,
+                                                     state=kind_states[kind])
+                recorder.add_items('scan', len(kind_entries[kind]))
+
+        for (kind, analyzer) in self.analyzers():
+            info("%s of %s" % (kind, group_name), 1)
+            analyzer.analyze_entries(group_name, kind_entries[kind], state=kind_states[kind])
+
+        return True
+
+    def run(self, group_names=None):
+        """
+        Analyze the targets of the config (only group_names if given).
+        """
+        for (kind, analyzer) in self.analyzers():
+            os.makedirs(analyzer.config['output_dir'], exist_ok=True)
+
+        for target_key in self.config['targets']:
+            if group_names is not None and target_key not in group_names:
+                continue
+            info("checking for %s" % target_key)
+            if not self.analyze_target(target_key):
+                danger("skipping")
+
+        if self.queue.cache is not None:
+            self.queue.cache.evict()
+
+        return self
+
+    def edge_series(self):
+        return self.queue.edge_series()
+
+    def entry_series(self):
+        return self.queue.entry_series()
+
+    def tuple_series(self):
+        return self.queue.tuple_series()
+
+    def crash_series(self):
+        return self.crashes.crash_series()
+
+    def dedup_crash_series(self):
+        return self.crashes.dedup_crash_series()
+
+    def hang_series(self):
+        return self.hangs.crash_series() if self.hangs is not None else {}
@@ -0,0 +1,81 @@
+import os
+
+from common_utils import *
+
+# columns of the original AFL plot_data, used when the file has no header line
+afl_plot_data_columns = ['unix_time', 'cycles_done', 'cur_path', 'paths_total', 'pending_total', 'pending_favs',
+                         'map_size', 'unique_crashes', 'unique_hangs', 'max_depth', 'execs_per_sec']
+
+# AFL++ renamed some columns, map them back to the AFL names
+plot_data_aliases = {
+    'cur_item': 'cur_path',
+    'corpus_count': 'paths_total',
+    'saved_crashes': 'unique_crashes',
+    'saved_hangs': 'unique_hangs'
+}
+
+
+def find_plot_data(target):
+    """
+    plot_data is written next to fuzzer_stats, so it is looked up the same way (unless given in the target).
+    """
+    if 'plot_data' in target:
+        return target['plot_data'] if os.path.isfile(target['plot_data']) else None
+
+    fuzzy_plot_data_loc = ['/../plot_data', '/plot_data']
+    for entry_dir in target['entry_dirs']:
+        for plot_data_loc in fuzzy_plot_data_loc:
+            plot_data_file = os.path.abspath(entry_dir) + plot_data_loc
+            if os.path.isfile(plot_data_file):
+                return plot_data_file
+    return None
+
+
+def parse_plot_data_header(line):
+    columns = [column.strip() for column in line.lstrip('#').split(',')]
+    return [plot_data_aliases.get(column, column) for column in columns]
+
+
+def read_plot_data(plot_data_file, start_time, bucket_margin, map_size):
+    """
+    Stream plot_data into bin dicts (key: bin_no, value: count) of edges, entries and crashes.
+    The edge count is exact when the fuzzer reports edges_found (AFL++), otherwise it is
+    approximated from the map density (map_size column, in percent) and the size of the map.
+    """
+    edge_no_dict = {}
+    entry_no_dict = {}
+    crash_no_dict = {}
+
+    columns = afl_plot_data_columns
+    with open(plot_data_file) as plot_data_fd:
+        for line in plot_data_fd:
+            if line.startswith('#'):
+                columns = parse_plot_data_header(line)
+                continue
+            tokens = line.split(',')
+            if len(tokens) < len(columns):
+                warn("cannot handle plot_data line: %s" % line.strip(), 1)
+                continue
+            row = dict(zip(columns, [token.strip() for token in tokens]))
+
+            if 'relative_time' in row:
+                rel_time = int(row['relative_time'])
+            else:
+                rel_time = int(row['unix_time']) - start_time
+            bin_no = int(rel_time / bucket_margin)
+
+            if 'edges_found' in row:
+                edge_no = int(row['edges_found'])
+            else:
+                edge_no = int(round(float(row['map_size'].rstrip('%')) * map_size / 100.0))
+
+            # the counters are cumulative, the last row of a bin wins
+            edge_no_dict[bin_no] = edge_no
+            entry_no_dict[bin_no] = int(row['paths_total'])
+            crash_no_dict[bin_no] = int(row['unique_crashes'])
+
+    for bin_dict in [edge_no_dict, entry_no_dict, crash_no_dict]:
+        if 0 not in bin_dict:
+            bin_dict[0] = 0
+
+    return edge_no_dict, entry_no_dict, crash_no_dict
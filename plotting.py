@@ -0,0 +1,13 @@
+import sys
+
+
+def pyplot():
+    """
+    matplotlib is only imported once a figure is actually drawn, and then with the headless Agg backend
+    (unless pyplot was already imported by the caller, e.g., in a notebook).
+    """
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
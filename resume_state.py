@@ -0,0 +1,77 @@
+import json
+import os
+
+from common_utils import *
+
+
+def state_file_name(config, group_name):
+    return config['output_dir'] + group_name + '_state.json'
+
+
+def load_state(config, group_name, signature):
+    """
+    Load the state saved by the previous (incremental) run of a target.
+    None is returned when there is no usable state, i.e., the target has to be processed from scratch.
+    """
+    state_file = state_file_name(config, group_name)
+    if not os.path.isfile(state_file):
+        return None
+
+    try:
+        with open(state_file) as fp:
+            state = json.load(fp)
+    except ValueError:
+        warn("broken state file %s, starting from scratch" % state_file, 1)
+        return None
+
+    if state.get('signature') != signature:
+        warn("settings of %s changed since the last run, starting from scratch" % group_name, 1)
+        return None
+
+    # json only has string keys
+    for dict_name in state['bin_dicts']:
+        bin_dict = state['bin_dicts'][dict_name]
+        state['bin_dicts'][dict_name] = dict((int(bin_no), bin_dict[bin_no]) for bin_no in bin_dict)
+
+    return state
+
+
+def save_state(config, group_name, state):
+    state_file = state_file_name(config, group_name)
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w') as fp:
+        json.dump(state, fp)
+    os.replace(temp_file, state_file)
+
+
+def new_state(signature):
+    return {
+        'signature': signature,
+        # the mtime of the newest processed entry
+        'watermark': -1,
+        # the processed entries having exactly the watermark mtime
+        'watermark_paths': [],
+        'entry_count': 0,
+        'bin_dicts': {}
+    }
+
+
+def filter_new_entries(entries, state):
+    watermark = state['watermark']
+    watermark_paths = set(state['watermark_paths'])
+    return [entry for entry in entries
+            if entry.m_time > watermark or (entry.m_time == watermark and entry.path not in watermark_paths)]
+
+
+def advance_watermark(state, entries):
+    """
+    Move the watermark past the given (sorted) entries.
+    """
+    if len(entries) == 0:
+        return
+    watermark = entries[-1].m_time
+    if watermark != state['watermark']:
+        state['watermark_paths'] = []
+    state['watermark'] = watermark
+    state['watermark_paths'] += [entry.path for entry in entries if entry.m_time == watermark]
+    state['entry_count'] += len(entries)
@@ -0,0 +1,121 @@
+import json
+import os
+import struct
+import numpy as np
+
+from common_utils import *
+
+# Binary format of the *_time.bin files written next to the *_time.txt files:
+#
+#     8 bytes   magic "FUSERIES"
+#     4 bytes   little-endian uint32, length of the json header
+#     n bytes   json header (bucket, start_time, group_name, dtype, length), padded with spaces
+#               so that the values start at a multiple of 64 bytes
+#     ...       the y values of bins 1..length as a flat array of dtype
+#
+# The x values are not stored, bin i is always at index i-1 (like line i of the text file).
+
+series_magic = b'FUSERIES'
+series_dtype = '<u4'
+series_alignment = 64
+
+
+def binary_file_name(data_file_name):
+    if data_file_name.endswith('.txt'):
+        return data_file_name[:-len('.txt')] + '.bin'
+    return data_file_name + '.bin'
+
+
+def write_series_file(file_name, y_vals, bucket, start_time, group_name):
+    header = {
+        'bucket': bucket,
+        'start_time': start_time,
+        'group_name': group_name,
+        'dtype': series_dtype,
+        'length': len(y_vals)
+    }
+    header_bytes = json.dumps(header).encode()
+    data_offset = len(series_magic) + 4 + len(header_bytes)
+    padding = (series_alignment - data_offset % series_alignment) % series_alignment
+    header_bytes += b' ' * padding
+
+    with open(file_name, 'wb') as fp:
+        fp.write(series_magic)
+        fp.write(struct.pack('<I', len(header_bytes)))
+        fp.write(header_bytes)
+        fp.write(np.asarray(y_vals).astype(series_dtype).tobytes())
+
+
+def read_series_file(file_name):
+    """
+    Map a *_time.bin file without copying it.
+    Returns the header dict and a read-only array of the y values.
+    """
+    with open(file_name, 'rb') as fp:
+        if fp.read(len(series_magic)) != series_magic:
+            raise ValueError("invalid file - %s is not a series file" % file_name)
+        (header_len,) = struct.unpack('<I', fp.read(4))
+        header = json.loads(fp.read(header_len).decode())
+
+    data_offset = len(series_magic) + 4 + header_len
+    if header['length'] == 0:
+        return header, np.zeros(0, dtype=header['dtype'])
+    y_vals = np.memmap(file_name, dtype=header['dtype'], mode='r', offset=data_offset, shape=(header['length'],))
+    return header, y_vals
+
+
+def read_csv_series(file_name):
+    y_vals = []
+    with open(file_name) as data_fd:
+        lines = data_fd.readlines()
+        for (i, line) in enumerate(lines):
+            tokens = line.split(',')
+            bin_no = int(tokens[0])
+            y_val = int(tokens[1])
+            if bin_no != i+1:
+                raise ValueError("invalid file - bin_no(%d), line_no(%d)" % (bin_no, i))
+            y_vals.append(y_val)
+    return np.array(y_vals, dtype=np.int64)
+
+
+def load_series(data_file, bucket=None):
+    """
+    Load the y values of a data file. The binary file is used when it exists (either given directly
+    or next to the given *.txt file); older runs only have the text file, which is parsed instead.
+    A text file newer than the binary file next to it wins: the binary file is left over from a run with
+    binary_output, and the text file was rewritten since (e.g., by an incremental run without it).
+    """
+    bin_file = data_file if data_file.endswith('.bin') else binary_file_name(data_file)
+    if not os.path.isfile(bin_file):
+        return read_csv_series(data_file)
+    if bin_file != data_file and os.stat(data_file).st_mtime_ns > os.stat(bin_file).st_mtime_ns:
+        warn("%s is older than %s, using the text file" % (bin_file, data_file), 1)
+        return read_csv_series(data_file)
+
+    header, y_vals = read_series_file(bin_file)
+    if bucket is not None and header['bucket'].lower()[0] != bucket.lower()[0]:
+        warn("%s uses bucket %s instead of %s" % (bin_file, header['bucket'], bucket))
+    return y_vals
+
+
+def collect_series_over_time(config, series, kind):
+    """
+    Write <group>_<kind>_time.txt (and the *.bin next to it with binary_output) for every group of a series.
+    """
+
+    # sort the group names, make sure every time the order is consistent
+    group_names = list(series.keys())
+    group_names.sort()
+
+    for group_name in group_names:
+        (x_vals, y_vals) = series[group_name]
+
+        info("saving %s-time info for %s" % (kind, group_name))
+        data_file_name = config['output_dir'] + '/' + group_name + '_' + kind + '_time.txt'
+        with open(data_file_name, 'w') as fp:
+            for (x, y) in zip(x_vals.tolist(), y_vals.tolist()):
+                fp.write('%d,%d\n' % (x, y))
+
+        if config['binary_output']:
+            write_series_file(binary_file_name(data_file_name), y_vals, config['bucket'],
+                              int(config['targets'][group_name]['start_time']), group_name)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from common_utils import *
+from entry_discovery import *
+
+shard_pattern = re.compile(r'(\d+)/(\d+)')
+
+shard_file_name = 'shard.json'
+
+
+def parse_shard(shard):
+    """
+    "i/N" (1 <= i <= N) -> (i, N), None if malformed.
+    """
+    match = shard_pattern.fullmatch(shard.strip())
+    if match is None:
+        return None
+    (shard_no, shard_count) = (int(match.group(1)), int(match.group(2)))
+    if shard_count < 1 or shard_no < 1 or shard_no > shard_count:
+        return None
+    return shard_no, shard_count
+
+
+def shard_dir_name(output_dir, shard_no, shard_count):
+    return os.path.join(output_dir, 'shard_%d_of_%d' % (shard_no, shard_count)) + '/'
+
+
+def compute_assignment(config, shard_count):
+    """
+    Split the targets of the config into shard_count lists: the targets are taken from the largest to the smallest
+    (by entry count, then name) and each goes to the least loaded shard so far.
+    """
+    target_sizes = []
+    for group_name in config['targets']:
+        entry_dirs = config['targets'][group_name].get('entry_dirs', [])
+        target_sizes.append((-count_entries(entry_dirs, config['entry_name_pattern']), group_name))
+    target_sizes.sort()
+
+    shard_loads = [0] * shard_count
+    shard_groups = [[] for i in range(0, shard_count)]
+    for (negative_size, group_name) in target_sizes:
+        lightest = shard_loads.index(min(shard_loads))
+        # empty targets still count a little, so that they are spread as well
+        shard_loads[lightest] += max(-negative_size, 1)
+        shard_groups[lightest].append(group_name)
+
+    return [sorted(groups) for groups in shard_groups]
+
+
+def assignment_file_name(config, shard_count):
+    # one assignment per split and set of targets, so a changed config never picks up an old assignment
+    targets_hash = hashlib.sha1('\n'.join(sorted(config['targets'].keys())).encode()).hexdigest()[:12]
+    return os.path.join(config['output_dir'], 'shard_assignment_%d_%s.json' % (shard_count, targets_hash))
+
+
+def load_assignment(config, shard_count):
+    """
+    The assignment of the targets to the shards, shared by all hosts through output_dir.
+    The first host computes it (from the entry counts it sees) and saves it, every other host reads it, so the
+    hosts agree even though the entry dirs keep growing while they start.
+    """
+    assignment_file = assignment_file_name(config, shard_count)
+    if not os.path.isfile(assignment_file):
+        os.makedirs(config['output_dir'], exist_ok=True)
+        temp_file = '%s.%d.tmp' % (assignment_file, os.getpid())
+        with open(temp_file, 'w') as fp:
+            json.dump(compute_assignment(config, shard_count), fp)
+        try:
+            # link fails if another host saved its assignment in the meantime, the first one wins
+            os.link(temp_file, assignment_file)
+        except FileExistsError:
+            pass
+        os.remove(temp_file)
+
+    with open(assignment_file) as fp:
+        return json.load(fp)
+
+
+def shard_targets(config, shard_no, shard_count):
+    """
+    The targets processed by shard_no, see load_assignment.
+    """
+    assignment = load_assignment(config, shard_count)
+    info("shard %d/%d: %d of %d targets" % (shard_no, shard_count, len(assignment[shard_no - 1]),
+                                            len(config['targets'])))
+    return assignment[shard_no - 1]
+
+
+def save_shard(config, tool, shard_no, shard_count, group_names, group_results):
+    """
+    Save the partial results of a shard into its dir (config['output_dir'] is the shard dir here).
+    group_names -- the targets assigned to the shard
+    group_results -- key: entry group name, value: start_time and state (see resume_state) of the target
+    """
+    shard = {
+        'tool': tool,
+        'shard': shard_no,
+        'shard_count': shard_count,
+        'bucket': config['bucket'],
+        'targets': group_names,
+        'groups': group_results
+    }
+    shard_file = os.path.join(config['output_dir'], shard_file_name)
+    temp_file = shard_file + '.tmp'
+    with open(temp_file, 'w') as fp:
+        json.dump(shard, fp)
+    os.replace(temp_file, shard_file)
+    ok("saved shard %d/%d to %s" % (shard_no, shard_count, config['output_dir']))
+
+
+def load_shards(config, tool):
+    """
+    Load the partial results of all shards under output_dir.
+    Returns a list of (shard dir, shard), or None if shards are missing or do not fit the config.
+    """
+    shards = []
+    for dir_name in sorted(os.listdir(config['output_dir'])):
+        shard_file = os.path.join(config['output_dir'], dir_name, shard_file_name)
+        if not dir_name.startswith('shard_') or not os.path.isfile(shard_file):
+            continue
+        with open(shard_file) as fp:
+            shard = json.load(fp)
+        if shard['tool'] != tool:
+            warn("%s was written by %s, skipping" % (shard_file, shard['tool']))
+            continue
+        if shard['bucket'] != config['bucket']:
+            danger("%s uses bucket %s instead of %s" % (shard_file, shard['bucket'], config['bucket']))
+            return None
+
+        # json only has string keys
+        for group_result in shard['groups'].values():
+            bin_dicts = group_result['state']['bin_dicts']
+            for dict_name in bin_dicts:
+                bin_dicts[dict_name] = dict((int(bin_no), bin_dicts[dict_name][bin_no])
+                                            for bin_no in bin_dicts[dict_name])
+
+        shards.append((os.path.join(config['output_dir'], dir_name), shard))
+
+    if len(shards) == 0:
+        danger("no shard found in %s" % config['output_dir'])
+        return None
+
+    shard_counts = set(shard['shard_count'] for (shard_dir, shard) in shards)
+    if len(shard_counts) > 1:
+        danger("shards of different splits (%s) in %s" % (sorted(shard_counts), config['output_dir']))
+        return None
+    shard_count = shard_counts.pop()
+    missing = sorted(set(range(1, shard_count + 1)) - set(shard['shard'] for (shard_dir, shard) in shards))
+    if len(missing) > 0:
+        danger("shards %s of %d are missing" % (', '.join(str(shard_no) for shard_no in missing), shard_count))
+        return None
+
+    if not check_shard_targets(config, shards):
+        return None
+
+    return shards
+
+
+def check_shard_targets(config, shards):
+    """
+    Every target of the config has to be assigned to exactly one shard, otherwise the merged outputs would
+    silently miss it (or take it from the shard written last).
+    """
+    # key: entry group name, value: the shards it is assigned to
+    target_shards = dict((group_name, []) for group_name in config['targets'])
+    for (shard_dir, shard) in shards:
+        # shards saved before the assignment was recorded only know the targets they analyzed
+        for group_name in shard.get('targets', list(shard['groups'].keys())):
+            target_shards.setdefault(group_name, []).append(shard['shard'])
+            if group_name not in shard['groups']:
+                warn("%s was skipped by shard %d" % (group_name, shard['shard']), 1)
+
+    valid = True
+    for group_name in sorted(target_shards.keys()):
+        shard_nos = sorted(target_shards[group_name])
+        if len(shard_nos) == 0:
+            danger("%s is in no shard" % group_name)
+            valid = False
+        elif len(shard_nos) > 1:
+            danger("%s is in several shards (%s)" % (group_name, ', '.join(str(shard_no) for shard_no in shard_nos)))
+            valid = False
+    return valid
+
+
+def copy_shard_files(shard_dir, output_dir, group_name, suffixes):
+    """
+    Copy the per-target side files (e.g., edge index, crash buckets) of a shard into the merged output dir.
+    """
+    for suffix in suffixes:
+        shard_file = os.path.join(shard_dir, group_name + suffix)
+        if os.path.isfile(shard_file):
+            shutil.copyfile(shard_file, os.path.join(output_dir, group_name + suffix))
@@ -0,0 +1,446 @@
+import json
+import mmap
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+from common_utils import *
+from coverage_cache import *
+from instrumentation import *
+
+valid_showmap_modes = ['single', 'batch']
+
+# "text": the "edge:count" lines afl-showmap writes by default; "binary": the raw bitmap of "afl-showmap -b"
+valid_showmap_formats = ['text', 'binary']
+
+# without "-r", the binary bitmap holds the AFL count class as a bit (1, 2, 4, ..., 128),
+# the text output its number (1 - 8)
+bitmap_class_lookup = np.array([value.bit_length() for value in range(0, 256)], dtype=np.uint8)
+
+# afl-showmap exits with 1 when the target timed out and with 2 when it crashed, the map is written in both cases
+showmap_exit_codes = [0, 1, 2]
+
+# per-process showmap settings, filled in by init_worker for pool workers
+worker_command = None
+worker_output = None
+worker_settings = None
+
+# the entries which could not be replayed (path, reason, attempts), see take_showmap_failures
+showmap_failures = []
+
+
+def parse_showmap_output(showmap_output):
+    """
+    Parse a showmap output file into the covered edge ids and their (classified) hit counts.
+    """
+    edge_ids = []
+    edge_counts = []
+    with open(showmap_output) as showmap_output_file:
+        lines = showmap_output_file.readlines()
+        for line in lines:
+            try:
+                edge_id = int(line.split(':')[0])
+                edge_count = int(line.split(':')[1])
+                edge_ids.append(edge_id)
+                edge_counts.append(edge_count)
+            except IndexError:
+                warn("cannot handle showmap output line: %s" % line, 1)
+    return make_edges(edge_ids, edge_counts)
+
+
+def parse_showmap_bitmap(showmap_output, raw_counts):
+    """
+    Read a binary showmap output (one byte per edge) with mmap, the covered edges are the non-zero bytes.
+    """
+    with open(showmap_output, 'rb') as showmap_output_file:
+        # mmap cannot map an empty file
+        if os.fstat(showmap_output_file.fileno()).st_size == 0:
+            return make_edges([], [])
+        with mmap.mmap(showmap_output_file.fileno(), 0, access=mmap.ACCESS_READ) as bitmap_buffer:
+            bitmap = np.frombuffer(bitmap_buffer, dtype=np.uint8)
+            edge_ids = np.flatnonzero(bitmap)
+            # fancy indexing copies, so nothing refers to the mapping once bitmap is gone
+            edge_counts = bitmap[edge_ids]
+            del bitmap
+
+    if not raw_counts:
+        edge_counts = bitmap_class_lookup[edge_counts]
+    return edge_ids.astype(np.uint32), edge_counts
+
+
+def parse_map(showmap_output, settings):
+    if settings['binary']:
+        return parse_showmap_bitmap(showmap_output, settings['raw_counts'])
+    return parse_showmap_output(showmap_output)
+
+
+def make_edges(edge_ids, edge_counts):
+    return (np.array(edge_ids, dtype=np.uint32),
+            np.minimum(np.array(edge_counts, dtype=np.int64), 255).astype(np.uint8))
+
+
+def showmap_binary_index(tokens):
+    """
+    Index of afl-showmap in the tokens of a showmap command, which may run it through a wrapper
+    (e.g., "timeout 600 afl-showmap ..."). None if the command does not run afl-showmap itself.
+    """
+    for (i, token) in enumerate(tokens):
+        if token == '--':
+            break
+        if os.path.basename(token) == 'afl-showmap':
+            return i
+    return None
+
+
+def sanitize_showmap_settings(config):
+    """
+    Defaults of the replay limits and the map format, shared by the sanitize_config of every tool running
+    afl-showmap.
+    """
+    # unit is second, per entry
+    if 'showmap_timeout' not in config:
+        config['showmap_timeout'] = None
+
+    # unit is MB, address space of afl-showmap and the target
+    if 'showmap_memory_limit' not in config:
+        config['showmap_memory_limit'] = None
+
+    if 'showmap_retries' not in config:
+        config['showmap_retries'] = 1
+
+    if int(config['showmap_retries']) < 0:
+        danger("showmap_retries should be at least 0")
+        return False
+
+    if config.get('showmap_mode') == 'batch' and 'showmap_command' in config \
+            and showmap_binary_index(config['showmap_command'].split(' ')) is None:
+        danger("batch mode inserts \"-i <dir>\" after afl-showmap, but showmap_command does not run afl-showmap")
+        return False
+
+    if 'showmap_format' not in config:
+        config['showmap_format'] = 'text'
+
+    if config['showmap_format'] not in valid_showmap_formats:
+        danger("Invalid showmap format")
+        danger("Valid formats are : %s" % ' '.join(valid_showmap_formats))
+        return False
+
+    if config['showmap_format'] == 'binary' and 'showmap_command' in config:
+        tokens = config['showmap_command'].split(' ')
+        binary_index = showmap_binary_index(tokens)
+        if binary_index is None:
+            danger("the binary format inserts \"-b\" after afl-showmap, but showmap_command does not run afl-showmap")
+            return False
+        options = tokens[:tokens.index('--')] if '--' in tokens else tokens
+        if '-b' not in options[binary_index + 1:]:
+            # ask afl-showmap for the binary bitmap, like "-i" in batch mode, right after the showmap binary
+            config['showmap_command'] = ' '.join(tokens[:binary_index + 1] + ['-b'] + tokens[binary_index + 1:])
+
+    return True
+
+
+# the settings of run_showmap without a config: no limits, text maps
+default_showmap_settings = {'timeout': None, 'memory_limit': None, 'retries': 0, 'binary': False,
+                            'raw_counts': False}
+
+
+def showmap_settings(config):
+    return {
+        'timeout': float(config['showmap_timeout']) if config['showmap_timeout'] else None,
+        'memory_limit': int(config['showmap_memory_limit']) if config['showmap_memory_limit'] else None,
+        'retries': int(config['showmap_retries']),
+        'binary': config['showmap_format'] == 'binary',
+        # "-r" makes afl-showmap report raw hit counts instead of count classes
+        'raw_counts': '-r' in config['showmap_command'].split(' ')
+    }
+
+
+def limit_memory(memory_limit):
+    def set_limit():
+        memory_bytes = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    return set_limit
+
+
+def run_showmap_process(command, output_path, timeout, memory_limit, items=1):
+    """
+    Run afl-showmap once. Returns None if it produced a fresh map, the reason of the failure otherwise.
+    """
+    # a stale map of the previous entry must never be parsed as the map of this one
+    if output_path is not None and os.path.isfile(output_path):
+        os.remove(output_path)
+
+    with recorder.stage('showmap_spawn'):
+        # showmap and the target get their own process group, so that a hang can be killed as a whole
+        proc = subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.PIPE, start_new_session=True,
+                                preexec_fn=limit_memory(memory_limit) if memory_limit is not None else None)
+    with recorder.stage('showmap_wait', items):
+        try:
+            proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            proc.communicate()
+            return 'timeout after %gs' % timeout
+
+    if proc.returncode not in showmap_exit_codes:
+        return 'exit status %d' % proc.returncode
+    if output_path is not None and not os.path.isfile(output_path):
+        return 'no output'
+    return None
+
+
+def run_showmap(showmap_command, showmap_output, entry_path, settings=None):
+    """
+    Replay one entry. A failed run (timeout, unexpected exit status, no map) is retried; an entry which still fails
+    is recorded in showmap_failures and counted as covering nothing.
+    settings -- limits and map format, see showmap_settings
+    """
+    settings = settings if settings is not None else default_showmap_settings
+    started = time.perf_counter()
+    temp_command = showmap_command.replace('##', showmap_output).replace('@@', entry_path)
+
+    reason = None
+    for attempt in range(0, settings['retries'] + 1):
+        reason = run_showmap_process(temp_command.split(' '), showmap_output, settings['timeout'],
+                                     settings['memory_limit'])
+        if reason is None:
+            break
+
+    if reason is not None:
+        warn("cannot replay %s (%s)" % (entry_path, reason), 1)
+        showmap_failures.append({'path': entry_path, 'reason': reason, 'attempts': settings['retries'] + 1})
+        edges = make_edges([], [])
+    else:
+        with recorder.stage('parse', 1):
+            edges = parse_map(showmap_output, settings)
+    recorder.add_latency(time.perf_counter() - started)
+    return edges
+
+
+def take_showmap_failures():
+    failures = list(showmap_failures)
+    del showmap_failures[:]
+    return failures
+
+
+def replay_failed(entry_path):
+    # failures are rare, a scan of the few recorded so far is fine
+    return any(failure['path'] == entry_path for failure in showmap_failures)
+
+
+def save_showmap_failures(config, group_name, failures, append):
+    """
+    Side report of the entries of a target which could not be replayed: <group>_showmap_failures.json.
+    """
+    failure_file = config['output_dir'] + group_name + '_showmap_failures.json'
+    if append and os.path.isfile(failure_file):
+        with open(failure_file) as fp:
+            failures = json.load(fp) + failures
+    with open(failure_file, 'w') as fp:
+        json.dump(failures, fp, indent=2)
+    warn("%d entries of %s could not be replayed, see %s" % (len(failures), group_name, failure_file))
+
+
+def run_showmap_batch(showmap_command, showmap_output, entry_paths, settings=None):
+    """
+    Replay a chunk of entries with a single afl-showmap process (AFL++ "-i dir -o dir" mode).
+    The entries are hard linked (or copied, across file systems) into a private input dir as 000000, 000001, ...
+    so the maps written by showmap can be matched back to the entries. Symlinks would not do, afl-showmap skips
+    everything but regular files in its input dir.
+    """
+    batch_dir = showmap_output + '.batch'
+    input_dir = batch_dir + '/in'
+    output_dir = batch_dir + '/out'
+    if os.path.isdir(batch_dir):
+        shutil.rmtree(batch_dir)
+    os.makedirs(input_dir)
+    os.makedirs(output_dir)
+
+    for (i, entry_path) in enumerate(entry_paths):
+        input_path = '%s/%06d' % (input_dir, i)
+        try:
+            os.link(entry_path, input_path)
+        except OSError:
+            shutil.copyfile(entry_path, input_path)
+
+    settings = settings if settings is not None else default_showmap_settings
+    timeout = settings['timeout'] * len(entry_paths) if settings['timeout'] is not None else None
+    started = time.perf_counter()
+    tokens = showmap_command.replace('##', output_dir).split(' ')
+    binary_index = showmap_binary_index(tokens)
+    if binary_index is None:
+        raise ValueError("batch mode needs afl-showmap in the showmap command: %s" % showmap_command)
+    temp_command = tokens[:binary_index + 1] + ['-i', input_dir] + tokens[binary_index + 1:]
+    reason = run_showmap_process(temp_command, None, timeout, settings['memory_limit'], len(entry_paths))
+    if reason is not None:
+        # isolate the entry responsible for the failure
+        warn("showmap failed on a batch of %d entries (%s), replaying them one by one" % (len(entry_paths), reason),
+             1)
+        shutil.rmtree(batch_dir)
+        return [run_showmap(showmap_command, showmap_output, entry_path, settings) for entry_path in entry_paths]
+
+    edges_list = []
+    # the maps showmap skipped, i.e., empty inputs and inputs without any coverage (or a problem with the entry)
+    missing = []
+    with recorder.stage('parse', len(entry_paths)):
+        for (i, entry_path) in enumerate(entry_paths):
+            map_file = '%s/%06d' % (output_dir, i)
+            if os.path.isfile(map_file):
+                edges_list.append(parse_map(map_file, settings))
+            else:
+                edges_list.append(None)
+                missing.append(i)
+
+    shutil.rmtree(batch_dir)
+
+    # one process for the whole chunk, every entry gets its share of the time
+    latency = (time.perf_counter() - started) / max(1, len(entry_paths))
+    for i in range(0, len(entry_paths) - len(missing)):
+        recorder.add_latency(latency)
+
+    for i in missing:
+        warn("no showmap output for %s in batch mode, replaying it alone" % entry_paths[i], 1)
+        edges_list[i] = run_showmap(showmap_command, showmap_output, entry_paths[i], settings)
+
+    return edges_list
+
+
+def init_worker(showmap_command, showmap_output, settings):
+    global worker_command, worker_output, worker_settings
+    # every worker gets its own showmap output, so the runs do not clobber each other
+    worker_command = showmap_command
+    worker_output = '%s.%d' % (showmap_output, os.getpid())
+    worker_settings = settings
+    # forget what the parent recorded before forking, only the measurements of this worker go back
+    recorder.drain()
+
+
+def run_showmap_in_worker(entry_path):
+    # the measurements of the worker go back with the result, see StageRecorder.merge
+    return run_showmap(worker_command, worker_output, entry_path, worker_settings), recorder.drain(), \
+        take_showmap_failures()
+
+
+def run_showmap_batch_in_worker(entry_paths):
+    return run_showmap_batch(worker_command, worker_output, entry_paths, worker_settings), recorder.drain(), \
+        take_showmap_failures()
+
+
+def replay_entries(config, entries, cache=None):
+    """
+    Replay the entries with afl-showmap and yield the (edge ids, hit counts) of each entry.
+    The results always come back in the order of entries (i.e., mtime order),
+    no matter how many workers are used or how the entries are batched.
+    Entries whose content is already in the cache are not replayed at all.
+    """
+    if cache is None:
+        for edges in replay_uncached_entries(config, entries):
+            yield edges
+        return
+
+    with recorder.stage('cache_lookup', len(entries)):
+        keys = [content_hash(entry.path) for entry in entries]
+
+        # only replay the first entry of every unknown content
+        missing_keys = set()
+        missing_entries = []
+        cache_hits = 0
+        duplicates = 0
+        for (entry, key) in zip(entries, keys):
+            if key in missing_keys:
+                duplicates += 1
+            elif cache.contains(key):
+                cache_hits += 1
+            else:
+                missing_keys.add(key)
+                missing_entries.append(entry)
+
+    info("%d of %d entries found in the coverage cache" % (cache_hits, len(entries)), 1)
+    if duplicates > 0:
+        info("%d entries have the same content as an earlier entry, they are not replayed again" % duplicates, 1)
+
+    replayed = replay_uncached_entries(config, missing_entries)
+    # key: content hash, value: path of the entry which could not be replayed
+    failed_keys = {}
+    for (entry, key) in zip(entries, keys):
+        if key in missing_keys:
+            # the replays come back in the same order as the entries, see above
+            edges = next(replayed)
+            # an entry which could not be replayed is not cached, it is tried again next time
+            if replay_failed(entry.path):
+                failed_keys[key] = entry.path
+            else:
+                cache.put(key, edges)
+            missing_keys.remove(key)
+        elif key in failed_keys:
+            # the same content, it would only fail again, but it is reported like its twin
+            showmap_failures.append({'path': entry.path, 'reason': 'same content as %s' % failed_keys[key],
+                                     'attempts': 0})
+            edges = make_edges([], [])
+        else:
+            edges = cache.get(key)
+            if edges is None:
+                warn("broken cache entry for %s, replaying it" % entry.path, 1)
+                edges = run_showmap(config['showmap_command'], config['showmap_output'], entry.path,
+                                    showmap_settings(config))
+                if not replay_failed(entry.path):
+                    cache.put(key, edges)
+        yield edges
+
+
+def replay_uncached_entries(config, entries):
+    workers = int(config['workers'])
+    settings = showmap_settings(config)
+    entry_paths = [entry.path for entry in entries]
+
+    if config['showmap_mode'] == 'batch':
+        batch_size = int(config['batch_size'])
+        if workers > 1:
+            # make sure every worker gets something to do on small queues
+            batch_size = max(1, min(batch_size, int((len(entry_paths) + workers - 1) / workers)))
+        chunks = [entry_paths[i:i + batch_size] for i in range(0, len(entry_paths), batch_size)]
+    else:
+        chunks = None
+
+    if workers <= 1:
+        if chunks is None:
+            for entry_path in entry_paths:
+                yield run_showmap(config['showmap_command'], config['showmap_output'], entry_path, settings)
+        else:
+            for chunk in chunks:
+                for edges in run_showmap_batch(config['showmap_command'], config['showmap_output'], chunk, settings):
+                    yield edges
+        return
+
+    # the outputs of the workers of this pool only, other runs (shards, tools) may share showmap_output
+    pool_dir = tempfile.mkdtemp(prefix=os.path.basename(config['showmap_output']) + '.',
+                                dir=os.path.dirname(os.path.abspath(config['showmap_output'])))
+    pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                initargs=(config['showmap_command'], os.path.join(pool_dir, 'map'), settings))
+    try:
+        # imap keeps the input order, so edges are merged back in mtime order
+        if chunks is None:
+            chunk_size = max(1, min(64, int(len(entry_paths) / (workers * 4))))
+            for (edges, measurements, failures) in pool.imap(run_showmap_in_worker, entry_paths, chunk_size):
+                recorder.merge(measurements)
+                showmap_failures.extend(failures)
+                yield edges
+        else:
+            for (edges_list, measurements, failures) in pool.imap(run_showmap_batch_in_worker, chunks):
+                recorder.merge(measurements)
+                showmap_failures.extend(failures)
+                for edges in edges_list:
+                    yield edges
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(pool_dir, ignore_errors=True)
@@ -0,0 +1,60 @@
+import os
+
+from common_utils import *
+
+
+def read_fuzzer_stats(stats_file):
+    """
+    The "key : value" lines of an AFL fuzzer_stats file, key: field name, value: string.
+    """
+    stats = {}
+    with open(stats_file, 'r') as statsfile:
+        for line in statsfile.readlines():
+            if ':' not in line:
+                continue
+            (key, value) = line.split(':', 1)
+            stats[key.strip()] = value.strip()
+    return stats
+
+
+def sanitize_target(target):
+    required_params = ['entry_dirs']
+
+    for param in required_params:
+        if param not in target:
+            danger("%s is missing in target")
+            return False
+
+    if len(target['entry_dirs']) == 0:
+        danger('No entry dir specified for target')
+        return False
+
+    else:
+        # fuzzy finding
+        fuzzy_stats_loc = ['/../fuzzer_stats', '/fuzzer_stats']
+        stats_file_found = False
+        stats_file = None
+        for entry_dir in target['entry_dirs']:
+            for stats_loc in fuzzy_stats_loc:
+                stats_file = os.path.abspath(entry_dir) + stats_loc
+                if os.path.isfile(stats_file):
+                    stats_file_found = True
+                    break
+            if stats_file_found:
+                break
+
+        if not stats_file_found and 'start_time' not in target:
+            danger('Neither start_time or fuzzer_stats found')
+            return False
+        elif stats_file_found:
+            # coexistence allowed but warn user
+            if 'start_time' in target:
+                warn('Warning: both "start_time" and fuzzer_stats file exist! "fuzzer_stats" will be used.')
+            stats = read_fuzzer_stats(stats_file)
+            if 'start_time' in stats:
+                target['start_time'] = int(stats['start_time'])
+            if 'start_time' not in target:
+                danger('Bad format: no "start_time" found in fuzzer_stats')
+                return False
+
+    return True
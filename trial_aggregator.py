@@ -0,0 +1,111 @@
+import numpy as np
+
+from common_utils import *
+
+valid_statistics = ['mean', 'median']
+valid_bands = ['none', 'ci95', 'p95']
+
+
+class TrialAggregator:
+    """
+    Aggregate the series of many trials one trial at a time.
+    Mean and variance are kept with Welford's algorithm, median and percentiles come from a per-bin
+    reservoir of reservoir_size samples (exact as long as there are no more trials than that).
+    Memory depends on the number of bins and reservoir_size, not on the number of trials.
+    Trials of different lengths are forward-filled with their last value up to the longest trial.
+    """
+    reservoir_size = 0
+    trial_no = 0
+
+    def __init__(self, reservoir_size=64, seed=0):
+        self.reservoir_size = reservoir_size
+        self.trial_no = 0
+        self.rng = np.random.RandomState(seed)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.means = np.zeros(0, dtype=np.float64)
+        self.m2s = np.zeros(0, dtype=np.float64)
+        self.reservoirs = np.zeros((0, reservoir_size), dtype=np.float32)
+        # (length, last value) of every trial, used to forward-fill the shorter ones
+        self.trial_tails = []
+        self.finalized = False
+
+    def grow(self, length):
+        extra = length - len(self.counts)
+        if extra <= 0:
+            return
+        self.counts = np.concatenate((self.counts, np.zeros(extra, dtype=np.int64)))
+        self.means = np.concatenate((self.means, np.zeros(extra, dtype=np.float64)))
+        self.m2s = np.concatenate((self.m2s, np.zeros(extra, dtype=np.float64)))
+        self.reservoirs = np.concatenate((self.reservoirs,
+                                          np.full((extra, self.reservoir_size), np.nan, dtype=np.float32)))
+
+    def update(self, start, y_vals):
+        """
+        Add one sample per bin for the bins start..start+len(y_vals)-1.
+        """
+        end = start + len(y_vals)
+        counts = self.counts[start:end] + 1
+        self.counts[start:end] = counts
+
+        # Welford
+        delta = y_vals - self.means[start:end]
+        self.means[start:end] += delta / counts
+        self.m2s[start:end] += delta * (y_vals - self.means[start:end])
+
+        # reservoir sampling (algorithm R) for every bin at once
+        bins = np.arange(start, end)
+        slots = counts - 1
+        full = slots >= self.reservoir_size
+        slots[full] = (self.rng.random_sample(np.count_nonzero(full)) * counts[full]).astype(np.int64)
+        keep = slots < self.reservoir_size
+        self.reservoirs[bins[keep], slots[keep]] = y_vals[keep]
+
+    def add(self, y_vals):
+        if self.finalized:
+            raise RuntimeError('cannot add trials to a finalized aggregator')
+        y_vals = np.asarray(y_vals, dtype=np.float64)
+        if len(y_vals) == 0:
+            warn("skipping an empty trial", 1)
+            return
+        self.grow(len(y_vals))
+        self.update(0, y_vals)
+        self.trial_tails.append((len(y_vals), y_vals[-1]))
+        self.trial_no += 1
+
+    def finalize(self):
+        if self.finalized:
+            return
+        length = len(self.counts)
+        for (trial_length, last_value) in self.trial_tails:
+            if trial_length < length:
+                self.update(trial_length, np.full(length - trial_length, last_value))
+        self.finalized = True
+
+    def mean(self):
+        self.finalize()
+        return self.means.copy()
+
+    def std(self):
+        self.finalize()
+        if self.trial_no < 2:
+            return np.zeros(len(self.means))
+        return np.sqrt(self.m2s / (self.trial_no - 1))
+
+    def ci95(self):
+        """
+        Normal-approximation 95% confidence interval of the mean.
+        """
+        margin = 1.96 * self.std() / np.sqrt(max(self.trial_no, 1))
+        return self.means - margin, self.means + margin
+
+    def percentile(self, q):
+        self.finalize()
+        if len(self.counts) == 0:
+            return np.zeros(0)
+        return np.nanpercentile(self.reservoirs, q, axis=1)
+
+    def median(self):
+        return self.percentile(50)
+
+    def p95(self):
+        return self.percentile(2.5), self.percentile(97.5)